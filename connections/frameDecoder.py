@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from threading import Lock
+from io import BytesIO
+from PIL import Image
+
+import os
+
+class FrameQueue:
+
+    # Bounded frame queue. LATEST keeps only the newest frame, FIFO keeps up
+    # to size frames in arrival order and drops the oldest when full.
+    LATEST = 'latest'
+    FIFO = 'fifo'
+
+    def __init__(self, size=1, policy=LATEST):
+        self.size = 1 if policy == FrameQueue.LATEST else max(1, size)
+        self.policy = policy
+        self.frames = deque()
+        self.lock = Lock()
+
+    def put(self, frame):
+        # returns the number of frames dropped to make room
+        with self.lock:
+            self.frames.append(frame)
+            dropped = 0
+            while len(self.frames) > self.size:
+                self.frames.popleft()
+                dropped += 1
+            return dropped
+
+    def get(self):
+        with self.lock:
+            if len(self.frames) == 0: return None
+            return self.frames.popleft()
+
+    def __len__(self):
+        return len(self.frames)
+
+class DecodedFrame:
+
+    # RGB pixels, bottom row first, ready for glTexImage2D/glTexSubImage2D,
+    # arrival is when the jpeg was received
+    def __init__(self, width, height, pixels, arrival=None):
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+        self.arrival = arrival
+
+class FrameDecoder:
+
+    # Decodes one stream's JPEG frames on a worker pool shared by all
+    # streams, PIL releases the GIL while decoding so streams decode in
+    # parallel. A stream has at most one decode in flight, frames arriving
+    # meanwhile wait in a FrameQueue with the stream's drop policy.
+    # With a target size the JPEG is decoded at the smallest DCT scale
+    # (1/2, 1/4 or 1/8) that still covers it.
+    WORKERS = max(2, min(8, os.cpu_count() or 2))
+    POOL = None
+    POOL_LOCK = Lock()
+
+    def __init__(self, container, size=1, policy=FrameQueue.LATEST):
+        self.container = container
+        self.lock = Lock()
+        self.pending = FrameQueue(size, policy)
+        self.busy = False
+        self.targetSize = None
+
+    def setTargetSize(self, size):
+        # (width, height) in pixels the frames are shown at, None for full size
+        if size != None and (size[0] <= 0 or size[1] <= 0): size = None
+        self.targetSize = size
+
+    @staticmethod
+    def getPool():
+        with FrameDecoder.POOL_LOCK:
+            if FrameDecoder.POOL == None:
+                FrameDecoder.POOL = ThreadPoolExecutor(FrameDecoder.WORKERS, thread_name_prefix='FrameDecoder')
+            return FrameDecoder.POOL
+
+    def submit(self, data, arrival=None):
+        # returns the number of waiting frames dropped
+        with self.lock:
+            if self.busy:
+                return self.pending.put((data, arrival))
+            self.busy = True
+        FrameDecoder.getPool().submit(self.__run, (data, arrival))
+        return 0
+
+    def __run(self, item):
+        while item != None:
+            try:
+                frame = FrameDecoder.decode(item[0], self.targetSize)
+                frame.arrival = item[1]
+                self.container.setFrame(frame)
+            except Exception:
+                pass
+            with self.lock:
+                item = self.pending.get()
+                if item == None: self.busy = False
+
+    @staticmethod
+    def decode(data, targetSize=None):
+        image = Image.open(BytesIO(data))
+        if targetSize != None:
+            image.draft('RGB', (int(targetSize[0]), int(targetSize[1])))
+        image = image.convert('RGB').transpose(Image.FLIP_TOP_BOTTOM)
+        return DecodedFrame(image.width, image.height, image.tobytes())
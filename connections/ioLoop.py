@@ -0,0 +1,47 @@
+import asyncio
+
+from threading import Thread, Lock
+
+class IoLoop:
+
+    INSTANCE = None
+    LOCK = Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.__run, name='IoLoop', daemon=True)
+        self.thread.start()
+
+    def __run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending: task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+
+    @staticmethod
+    def get():
+        with IoLoop.LOCK:
+            if IoLoop.INSTANCE == None:
+                IoLoop.INSTANCE = IoLoop()
+            return IoLoop.INSTANCE
+
+    @staticmethod
+    def submit(coro):
+        # thread safe, returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coro, IoLoop.get().loop)
+
+    @staticmethod
+    def call(func, *args):
+        # thread safe, runs func on the io thread
+        IoLoop.get().loop.call_soon_threadsafe(func, *args)
+
+    @staticmethod
+    def shutdown(timeout=5):
+        with IoLoop.LOCK:
+            instance = IoLoop.INSTANCE
+            IoLoop.INSTANCE = None
+        if instance == None: return
+        instance.loop.call_soon_threadsafe(instance.loop.stop)
+        instance.thread.join(timeout)
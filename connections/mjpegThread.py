@@ -1,26 +1,78 @@
 from threading import Thread
 from mjpeg.client import MJPEGClient
 from urllib.request import urlopen
-from io import BytesIO
 
-import time
+from connections.frameDecoder import FrameDecoder, FrameQueue
+from collections import deque
 
-POLLING_RATE = 48
+import numpy as np
+import time
 
 def handler(signum, frame):
     raise Exception("Time is up")
 
 class StreamContainer:
-    def __init__(self):
-        self.stream = None
+    # jpeg frames go in through decode, the render thread takes decoded
+    # frames with getFrame. Frames waiting to be decoded and waiting to be
+    # shown are both held in FrameQueues with the same size and policy.
+    AGE_WINDOW = 256
+
+    def __init__(self, size=1, policy=FrameQueue.LATEST):
+        self.frames = FrameQueue(size, policy)
+        self.decoder = FrameDecoder(self, size, policy)
+        self.resetStats()
+
+    def resetStats(self):
+        self.received = 0
+        self.decoded = 0
+        # one counter per writing thread, the mjpeg thread drops frames
+        # waiting for the decoder, the decoder drops frames waiting for display
+        self.droppedUndecoded = 0
+        self.droppedDecoded = 0
+        self.displayed = 0
+        self.lastArrival = None
+        self.frameInterval = None
+        self.ages = deque(maxlen=StreamContainer.AGE_WINDOW)
     
-    def getStream(self):
-        stream = self.stream
-        self.stream = None
-        return stream
+    def getFrame(self):
+        frame = self.frames.get()
+        if frame == None: return None
+        self.displayed += 1
+        if frame.arrival != None: self.ages.append(time.time() - frame.arrival)
+        return frame
     
-    def setStream(self, stream):
-        self.stream = stream
+    def setFrame(self, frame):
+        self.decoded += 1
+        self.droppedDecoded += self.frames.put(frame)
+
+    def decode(self, data, arrival=None):
+        if arrival == None: arrival = time.time()
+        self.received += 1
+        if self.lastArrival != None:
+            # smoothed time between frames as the camera actually sends them
+            interval = arrival - self.lastArrival
+            self.frameInterval = interval if self.frameInterval == None else 0.9*self.frameInterval + 0.1*interval
+        self.lastArrival = arrival
+        self.droppedUndecoded += self.decoder.submit(data, arrival)
+
+    def getFrameRate(self):
+        if self.frameInterval == None or self.frameInterval <= 0: return 0
+        return 1/self.frameInterval
+
+    def getStats(self):
+        # age is the time from a frame's arrival to it being taken for display
+        ages = np.array(self.ages)*1000
+        return {
+            'received': self.received,
+            'decoded': self.decoded,
+            'dropped': self.droppedUndecoded + self.droppedDecoded,
+            'displayed': self.displayed,
+            'fps': self.getFrameRate(),
+            'age': tuple(np.percentile(ages, (50, 95, 99))) if len(ages) > 0 else None,
+        }
+
+    def setTargetSize(self, size):
+        self.decoder.setTargetSize(size)
 
 def createMjpegThread(container, url, stop):
     t = Thread(target = MjpegConnection, args =(container, url, stop))
@@ -47,13 +99,9 @@ def MjpegConnection(container, url, stop):
         except:
             stop = lambda:True
     running = False
-    start = time.time_ns()
-    delay = 1/POLLING_RATE*1000000000
-    rate = 0
-    accum = 0
+    # dequeue_buffer blocks until the camera sends a frame, so frames are
+    # taken at the stream's own rate rather than polled
     while not stop():
-        time_past = time.time_ns() - start
-        start = time.time_ns()
         if not running:
             if client.reconnects > 1:
                 stop = lambda:True
@@ -65,19 +113,13 @@ def MjpegConnection(container, url, stop):
         try:
             # print(client._incoming)
             buf = client.dequeue_buffer(timeout=1)
-            stream = BytesIO(buf.data)
-            container.setStream(stream)
+            arrival = time.time()
+            data = bytes(buf.data)
             client.enqueue_buffer(buf)
+            container.decode(data, arrival)
         except Exception as e:
             # print(f'================error================{client}')
             stop = lambda:True
-        rate += 1
-        accum += time_past
-        time.sleep(max(0.01, (delay-time_past)/1000000000))
-        if accum >= 10000000000:
-            # print(f'MJPEG Polling Rate: {int(rate/10)}/s')
-            accum -= 10000000000
-            rate = 0
     if connectionOpen:
         client.stop()
     
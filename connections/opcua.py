@@ -1,17 +1,62 @@
-from asyncua import Client
+from asyncua import Client, ua
+from datetime import datetime, timezone
 import asyncio
 
-from threading import Thread
 import time
 
+from connections.ioLoop import IoLoop
+from connections.opcuaMonitorParams import MonitorParams
+from connections.opcuaNodeCache import OpcuaNodeCache
+from connections.opcuaSubscriptionClass import SubscriptionClass, AdaptiveRate
+from connections.telemetryDispatcher import TelemetryDispatcher
+from connections.telemetryRecorder import TelemetryRecorder, toEpoch
+
 from utils.debug import *
 import random
 
+class ChannelGroup:
+
+    # double buffered snapshot of a set of keys, written on the io thread
+    # and read lock free on the render thread
+    def __init__(self, keys, default=0):
+        self.keys = keys
+        self.buffers = [[default]*len(keys), [default]*len(keys)]
+        self.front = 0
+        self.seq = 0
+        self.staged = {}
+
+    def stage(self, index, value):
+        self.staged[index] = value
+
+    def commit(self):
+        if len(self.staged) == 0: return
+        staged = self.staged
+        self.staged = {}
+        back = self.buffers[1-self.front]
+        back[:] = self.buffers[self.front]
+        for i, v in staged.items():
+            back[i] = v
+        self.front = 1-self.front
+        self.seq += 1
+
+    def read(self):
+        while True:
+            seq = self.seq
+            values = tuple(self.buffers[self.front])
+            if seq == self.seq: return (seq, values)
+
 class OpcuaContainer:
     def __init__(self):
         self.updated = {}
         self.opcuaDict = {}
         self.nodeMapping = {}
+        self.groups = {}
+        self.keyGroups = {}
+        self.listeners = {}
+        self.changedKeys = set()
+        self.commitPending = False
+        # key -> [source time, receive time, receive frame, consumed frame]
+        self.stamps = {}
     
     def getValue(self, key, default=None):
         if not key in self.opcuaDict: return (default, 0)
@@ -21,177 +66,509 @@ class OpcuaContainer:
     def setValue(self, key, value, type):
         self.updated[key] = True
         self.opcuaDict[key] = (value, type)
+        if key in self.listeners:
+            self.changedKeys.add(key)
+        elif not key in self.keyGroups: return
+        for group, index in self.keyGroups.get(key, ()):
+            group.stage(index, value)
+        self.__scheduleCommit()
     
     def hasUpdated(self, key):
         if not key in self.opcuaDict: return False
         return self.updated[key]
 
+    def addGroup(self, name, keys, default=0):
+        group = ChannelGroup(keys, default)
+        self.groups[name] = group
+        for i, key in enumerate(keys):
+            self.keyGroups.setdefault(key, []).append((group, i))
+
+    def getGroup(self, name):
+        # returns (seq, values), seq increases by one per committed snapshot
+        return self.groups[name].read()
+
+    def hasGroupUpdated(self, name, seq):
+        return self.groups[name].seq != seq
+
+    def addListener(self, keys, callback):
+        # callback runs on the render thread via the TelemetryDispatcher
+        # on any frame where one of keys changed
+        for key in keys:
+            self.listeners.setdefault(key, []).append(callback)
+
+    def __scheduleCommit(self):
+        # all notifications of one publish response are delivered in a single
+        # callback on the io loop, deferring the commit to the next loop
+        # iteration publishes them together as one snapshot
+        if self.commitPending: return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.__commitGroups()
+            return
+        self.commitPending = True
+        loop.call_soon(self.__commitGroups)
+
+    def __commitGroups(self):
+        self.commitPending = False
+        for group in self.groups.values():
+            group.commit()
+        changedKeys = self.changedKeys
+        self.changedKeys = set()
+        for key in changedKeys:
+            for callback in self.listeners[key]:
+                TelemetryDispatcher.notify(callback)
+
     def datachange_notification(self, node, value, data):
         # print("Data change", self.nodeMapping[node][0], value, self.nodeMapping[node][1])
-        self.setValue(self.nodeMapping[node][0], value, self.nodeMapping[node][1])
+        key, dtype = self.nodeMapping[node]
+        dv = data.monitored_item.Value
+        received = time.time()
+        recorder = TelemetryRecorder.INSTANCE
+        if recorder != None:
+            recorder.record(key, value, dv.SourceTimestamp, dv.ServerTimestamp, received)
+        self.stamps[key] = [toEpoch(dv.SourceTimestamp), received, TelemetryDispatcher.FRAME, None]
+        self.setValue(key, value, dtype)
+
+    def getStamp(self, key):
+        # (source time, receive time, receive frame, consumed frame) of the
+        # latest value, consumed frame is None until consumeStamps saw it
+        stamp = self.stamps.get(key, None)
+        return None if stamp == None else tuple(stamp)
+
+    def getLastReceived(self, keys):
+        # receive time of the newest value among keys, None if none arrived
+        received = [self.stamps[key][1] for key in keys if key in self.stamps]
+        return max(received) if len(received) > 0 else None
+
+    def mergeHistory(self, samples):
+        # samples is {key: [DataValue]} recovered for a gap in the session.
+        # They go to the recorder in source time order and only replace a
+        # value if no newer one arrived live in the meantime.
+        recorder = TelemetryRecorder.INSTANCE
+        merged = []
+        for key, values in samples.items():
+            for dv in values:
+                source = toEpoch(dv.SourceTimestamp)
+                if source == source: merged.append((source, key, dv))
+        merged.sort(key=lambda s: s[0])
+        now = time.time()
+        for source, key, dv in merged:
+            if recorder != None:
+                recorder.record(key, dv.Value.Value, dv.SourceTimestamp, dv.ServerTimestamp, now)
+            stamp = self.stamps.get(key, None)
+            if stamp != None and source <= stamp[0]: continue
+            # consumed up front so backfilled values stay out of the latency stats
+            self.stamps[key] = [source, now, TelemetryDispatcher.FRAME, TelemetryDispatcher.FRAME]
+            self.setValue(key, dv.Value.Value, dv.Value.VariantType)
+        return len(merged)
+
+    def getLatestStamp(self, keys):
+        # stamp of the most recently received value among keys
+        stamps = [self.stamps[key] for key in keys if key in self.stamps]
+        if len(stamps) == 0: return None
+        return tuple(max(stamps, key=lambda s: s[1]))
+
+    def consumeStamps(self, keys, latency, delay=0):
+        # called by the render thread consumer of keys, records each new
+        # value's latency into latency (a TelemetryLatency) once, delay is
+        # how much later than now the consumer actually draws the value
+        now = time.time() + delay
+        frame = TelemetryDispatcher.FRAME
+        for key in keys:
+            stamp = self.stamps.get(key, None)
+            if stamp == None or stamp[3] != None: continue
+            stamp[3] = frame
+            latency.record(stamp[0], stamp[1], stamp[2], now, frame)
 
     def setNodeMap(self, node, key, type):
         self.nodeMapping[node] = (key, type)
 
+class OpcuaSessionPool:
+
+    # all access happens on the io loop
+    SESSIONS = {}
+    REFS = {}
+
+    @staticmethod
+    async def acquire(host):
+        # never raises, the session keeps reconnecting in the background
+        # and users wait on Opcua.waitConnected
+        if not host in OpcuaSessionPool.SESSIONS:
+            session = Opcua(host)
+            session.start()
+            OpcuaSessionPool.SESSIONS[host] = session
+            OpcuaSessionPool.REFS[host] = 0
+        OpcuaSessionPool.REFS[host] += 1
+        return OpcuaSessionPool.SESSIONS[host]
+
+    @staticmethod
+    async def release(host):
+        if not host in OpcuaSessionPool.SESSIONS: return
+        OpcuaSessionPool.REFS[host] -= 1
+        if OpcuaSessionPool.REFS[host] > 0: return
+        session = OpcuaSessionPool.SESSIONS.pop(host)
+        OpcuaSessionPool.REFS.pop(host)
+        await session.close()
+        print(f'Opcua session closed: {host}')
+
+    @staticmethod
+    def getRefCount(host):
+        return OpcuaSessionPool.REFS.get(host, 0)
+
+    @staticmethod
+    def getSessionCount():
+        return len(OpcuaSessionPool.SESSIONS)
+
+    @staticmethod
+    def getStats():
+        return {host:session.getStats() for host, session in list(OpcuaSessionPool.SESSIONS.items())}
+
 class Opcua:
 
     DEFAULT_POLLING_RATE = 60
+    DEFAULT_WRITE_BATCH = 64
+
+    # read the history of subscribed channels for the time a session was down
+    HISTORY_BACKFILL = False
+    BACKFILL_BATCH = 64
+    BACKFILL_PAGE = 1000
+    BACKFILL_MAX_GAP = 600
+
+    KEEPALIVE_INTERVAL = 1
+    KEEPALIVE_TIMEOUT = 2
+    MIN_BACKOFF = 0.5
+    MAX_BACKOFF = 30
+    RESUBSCRIBE_DELAY = 5
 
     def __init__(self, host):
         self.OpcUaHost = host
         self.opcuaClient = Client(self.OpcUaHost)
-        asyncio.run(self.opcuaClient.connect())
-        self.nodeDict = {}
+        self.nodeCache = OpcuaNodeCache(self.opcuaClient, self.OpcUaHost)
+        self.connected = asyncio.Event()
+        self.connectionLost = asyncio.Event()
+        self.supervisor = None
+
+        self.hasConnected = False
+        self.reconnects = 0
+        self.failedAttempts = 0
+        self.downSince = None
+        self.lastRecoverTime = None
+        self.totalDowntime = 0
+
+    def start(self):
+        self.supervisor = asyncio.get_running_loop().create_task(self.__supervise())
+
+    async def close(self):
+        if self.supervisor != None:
+            self.supervisor.cancel()
+            try:
+                await self.supervisor
+            except asyncio.CancelledError:
+                pass
+        if not self.connected.is_set(): return
+        self.connected.clear()
+        await self.__disconnect()
+
+    async def __supervise(self):
+        backoff = Opcua.MIN_BACKOFF
+        while True:
+            if not await self.__connect():
+                self.failedAttempts += 1
+                await asyncio.sleep(backoff)
+                backoff = min(backoff*2, Opcua.MAX_BACKOFF)
+                continue
+            backoff = Opcua.MIN_BACKOFF
+            await self.__keepalive()
+            self.connected.clear()
+            self.downSince = time.time()
+            self.connectionLost.set()
+            print(f'Opcua session lost: {self.OpcUaHost}')
+            await self.__disconnect()
+
+    async def __connect(self):
+        # a fresh client per attempt, asyncua clients are not reusable after a drop
+        client = Client(self.OpcUaHost)
+        try:
+            await client.connect()
+            self.opcuaClient = client
+            self.nodeCache.setClient(client)
+            await self.nodeCache.load()
+        except Exception:
+            try:
+                await asyncio.wait_for(client.disconnect(), Opcua.KEEPALIVE_TIMEOUT)
+            except Exception:
+                pass
+            return False
+        if self.hasConnected:
+            self.reconnects += 1
+            self.lastRecoverTime = time.time() - self.downSince
+            self.totalDowntime += self.lastRecoverTime
+            print(f'Opcua session recovered: {self.OpcUaHost} after {self.lastRecoverTime:.1f}s')
+        else:
+            print(f'Opcua session opened: {self.OpcUaHost}')
+        self.hasConnected = True
+        self.downSince = None
+        self.connectionLost = asyncio.Event()
+        self.connected.set()
+        return True
+
+    async def __keepalive(self):
+        while True:
+            await asyncio.sleep(Opcua.KEEPALIVE_INTERVAL)
+            try:
+                await asyncio.wait_for(self.opcuaClient.nodes.server_state.read_value(), Opcua.KEEPALIVE_TIMEOUT)
+            except Exception:
+                return
+
+    async def __disconnect(self):
+        try:
+            await asyncio.wait_for(self.opcuaClient.disconnect(), Opcua.KEEPALIVE_TIMEOUT)
+        except Exception:
+            pass
+
+    async def waitConnected(self, stop):
+        # returns False if stop was set before the session came up
+        if not self.connected.is_set():
+            await Opcua.waitAny(stop, self.connected)
+        return not stop.is_set()
+
+    def getStats(self):
+        downtime = self.totalDowntime
+        if self.downSince != None and self.hasConnected:
+            downtime += time.time() - self.downSince
+        return {
+            'connected': self.connected.is_set(),
+            'reconnects': self.reconnects,
+            'failedAttempts': self.failedAttempts,
+            'lastRecoverTime': self.lastRecoverTime,
+            'totalDowntime': downtime,
+        }
+
+    async def resolveNodes(self, names):
+        return await self.nodeCache.resolve(names)
 
     async def setValue(self, node, value, type):
         try:
-            if not node in self.nodeDict:
-                self.nodeDict[node] = self.opcuaClient.get_node(node)
-            return await self.nodeDict[node].set_value(value, type)
+            return await self.nodeCache.getNode(node).set_value(value, type)
         except Exception:
             raise Exception(f'Error setting value')
 
+    async def setValues(self, items):
+        # items is a list of (node, value, type), sent as a single WriteRequest
+        try:
+            nodes = [self.nodeCache.getNode(node) for node, _, _ in items]
+            values = [ua.DataValue(ua.Variant(value, type)) for _, value, type in items]
+            return await self.opcuaClient.write_values(nodes, values)
+        except Exception:
+            raise Exception(f'Error setting values')
+
     async def getValue(self, node):
         try:
-            if not node in self.nodeDict:
-                self.nodeDict[node] = self.opcuaClient.get_node(node)
-            return (await self.nodeDict[node].get_value(), await self.nodeDict[node].read_data_type_as_variant_type())
+            if self.nodeCache.getType(node) == None:
+                await self.nodeCache.resolve([node])
+            return (await self.nodeCache.getNode(node).get_value(), self.nodeCache.getType(node))
         except Exception:
             raise Exception(f'Error getting value')
     
-    def stop(self):
-        asyncio.run(self.opcuaClient.disconnect())
-
     @staticmethod
-    def createOpcuaReceiverThread(container, host, data, stop, pollingRate=DEFAULT_POLLING_RATE):
-        # t = Thread(target = Opcua.opcuaReceiverConnection, args =(container, host, data, stop, pollingRate))
-        t = Thread(target = Opcua.opcuaSubscriptionReciever, args =(container, host, data, stop, pollingRate))
-        t.start()
-        return t
+    def createOpcuaReceiverTask(container, host, data, stop, pollingRate=DEFAULT_POLLING_RATE, monitoring=None, classes=None):
+        # return IoLoop.submit(Opcua.opcuaReceiverConnection(container, host, data, stop, pollingRate))
+        return IoLoop.submit(Opcua.opcuaSubscriptionReciever(container, host, data, stop, pollingRate, monitoring, classes))
     
     @staticmethod
-    def opcuaSubscriptionReciever(container, host, data, stop, pollingRate=DEFAULT_POLLING_RATE):
-        try:
-            client = Opcua(host)
-        except:
-            print(f'Opcua receiver thread stopping: {host}')
-            stop = lambda:True
-            return
-        nodes = []
-        for nodename in data:
-            node = client.opcuaClient.get_node(nodename)
-            dtype = asyncio.run(node.read_data_type_as_variant_type())
-            container.setNodeMap(node, nodename, dtype)
-            nodes.append(node)
-        subscription = asyncio.run(client.opcuaClient.create_subscription(1000/pollingRate, container))
-        handle = asyncio.run(subscription.subscribe_data_change(nodes))
-        while not stop():
-            asyncio.run(asyncio.sleep(0.1))
-
-        asyncio.run(subscription.unsubscribe(handle))
-        client.stop()
-        print(f'Opcua receiver thread stopped: {host}')
-        pass
+    async def subscribeNodes(subscription, nodes, params):
+        # one CreateMonitoredItems call for all nodes, each with its own
+        # sampling interval, queue size and deadband filter
+        requests = []
+        for node, p in zip(nodes, params):
+            requests.append(subscription._make_monitored_item_request(
+                node, ua.AttributeIds.Value, p.createFilter(), p.queueSize, ua.MonitoringMode.Reporting, p.samplingInterval))
+        return await subscription.create_monitored_items(requests)
 
-    @staticmethod # old receiver
-    def opcuaReceiverConnection(container, host, data, stop, pollingRate=DEFAULT_POLLING_RATE):
-        print(f'Opcua receiver thread started: {host}')
-        start = time.time_ns()
-        nanoPerPoll = 1/pollingRate*1000000000
+    @staticmethod
+    async def opcuaSubscriptionReciever(container, host, data, stop, pollingRate=DEFAULT_POLLING_RATE, monitoring=None, classes=None):
+        client = await OpcuaSessionPool.acquire(host)
+        monitoring = monitoring or {}
+        plan = SubscriptionClass.plan(data, classes or {}, SubscriptionClass.forRate(pollingRate))
+        gapStart = None
+        backfills = []
         try:
-            client = Opcua(host)
-        except:
-            print(f'Opcua receiver thread stopping: {host}')
-            stop = lambda:True
-            return
-        rate = 0
-        accum = 0
-        timeCounter = 0
-        start = time.time_ns()
-        while not stop():
-            current = time.time_ns()
-            time_past = current - start
-            accum += time_past
-            timeCounter += time_past
-            start = current
-            if accum >= nanoPerPoll:
+            # subscriptions and monitored items are rebuilt every time the
+            # session comes back after a drop
+            while await client.waitConnected(stop):
+                lost = client.connectionLost
+                subscriptions = []
+                adapters = []
                 try:
-                    loop = asyncio.get_event_loop()
-                    task = loop.create_task(Opcua.OpcuaGetData(container, data, client))
-                    loop.run_until_complete(task)
-                    # asyncio.run(Opcua.OpcuaGetData(container, data, client))
-                except:
-                    return
-                rate += 1
-                accum = 0
-            else:
-                time.sleep((nanoPerPoll - accum)/1000000000)
-            if timeCounter >= 10000000000:
-                # print(f'Opcua receiver polling rate: {int(rate/10)}/s')
-                timeCounter -= 10000000000
-                rate = 0
-        client.stop()
-        print(f'Opcua receiver thread stopped: {host}')
+                    nodes = {}
+                    for nodename, (node, dtype) in zip(data, await client.resolveNodes(data)):
+                        container.setNodeMap(node, nodename, dtype)
+                        nodes[nodename] = node
+                    # one subscription per priority class
+                    for sclass, keys in plan.items():
+                        handler = sclass.createHandler(container)
+                        subscription = await client.opcuaClient.create_subscription(sclass.createParameters(), handler)
+                        subscriptions.append(subscription)
+                        await Opcua.subscribeNodes(subscription, [nodes[k] for k in keys], [monitoring.get(k, MonitorParams.DEFAULT) for k in keys])
+                        if sclass.adaptive != None:
+                            adapters.append(asyncio.ensure_future(Opcua.adaptSubscription(subscription, handler, sclass)))
+                    if gapStart != None and Opcua.HISTORY_BACKFILL:
+                        # runs alongside the new subscriptions, live values keep flowing
+                        gapEnd = time.time()
+                        backfills.append(asyncio.ensure_future(Opcua.backfill(client, container, nodes, max(gapStart, gapEnd - Opcua.BACKFILL_MAX_GAP), gapEnd)))
+                    gapStart = None
+                except Exception as e:
+                    print(f'Opcua receiver subscribe failed: {host} {e}')
+                    for adapter in adapters: adapter.cancel()
+                    await Opcua.deleteSubscriptions(subscriptions)
+                    await Opcua.waitStop(stop, Opcua.RESUBSCRIBE_DELAY)
+                    continue
+                await Opcua.waitAny(stop, lost)
+                for adapter in adapters: adapter.cancel()
+                if stop.is_set():
+                    # the session is shared, so the subscriptions have to be deleted
+                    # explicitly instead of going away with the disconnect
+                    if not lost.is_set():
+                        await Opcua.deleteSubscriptions(subscriptions)
+                    break
+                if gapStart == None:
+                    gapStart = container.getLastReceived(data) or client.downSince or time.time()
+                print(f'Opcua receiver resubscribing: {host}')
+        finally:
+            for backfill in backfills: backfill.cancel()
+            await OpcuaSessionPool.release(host)
+        print(f'Opcua receiver task stopped: {host}')
+
+    @staticmethod
+    async def adaptSubscription(subscription, handler, sclass):
+        # moves the subscription's publishing interval within sclass.adaptive
+        # according to how often its items actually change
+        interval = sclass.publishingInterval
+        votes = 0
+        handler.takeMostActive()
+        while True:
+            await asyncio.sleep(AdaptiveRate.WINDOW)
+            activity = handler.takeMostActive()/(AdaptiveRate.WINDOW*1000/interval)
+            target, votes = sclass.adaptive.next(interval, activity, votes)
+            if target == interval: continue
+            try:
+                await subscription.update(sclass.createModifyParameters(subscription.subscription_id, target))
+            except Exception as e:
+                print(f'Opcua subscription rate change failed: {e}')
+                return
+            interval = target
+            handler.publishingInterval = target
+
+    @staticmethod
+    async def backfill(client, container, nodes, start, end):
+        # nodes is {key: node}, HistoryRead in batches of BACKFILL_BATCH nodes
+        # and pages of BACKFILL_PAGE values, following continuation points
+        details = ua.ReadRawModifiedDetails()
+        details.IsReadModified = False
+        details.StartTime = datetime.fromtimestamp(start, timezone.utc)
+        details.EndTime = datetime.fromtimestamp(end, timezone.utc)
+        details.NumValuesPerNode = Opcua.BACKFILL_PAGE
+        details.ReturnBounds = False
+        samples = {key:[] for key in nodes}
+        pending = [(key, None) for key in nodes]
+        try:
+            while len(pending) > 0:
+                batch = pending[:Opcua.BACKFILL_BATCH]
+                pending = pending[Opcua.BACKFILL_BATCH:]
+                params = ua.HistoryReadParameters()
+                params.HistoryReadDetails = details
+                params.TimestampsToReturn = ua.TimestampsToReturn.Both
+                params.ReleaseContinuationPoints = False
+                for key, continuation in batch:
+                    valueid = ua.HistoryReadValueId()
+                    valueid.NodeId = nodes[key].nodeid
+                    valueid.IndexRange = ''
+                    valueid.ContinuationPoint = continuation
+                    params.NodesToRead.append(valueid)
+                results = await client.opcuaClient.uaclient.history_read(params)
+                for (key, _), result in zip(batch, results):
+                    # nodes without history just report a bad status
+                    if not result.StatusCode.is_good(): continue
+                    if result.HistoryData != None and result.HistoryData.DataValues:
+                        samples[key] += result.HistoryData.DataValues
+                    if result.ContinuationPoint:
+                        pending.append((key, result.ContinuationPoint))
+        except Exception as e:
+            print(f'Opcua history backfill failed: {e}')
+        count = container.mergeHistory(samples)
+        print(f'Opcua history backfill: {count} values over {end-start:.1f}s')
+
+    @staticmethod
+    async def deleteSubscriptions(subscriptions):
+        for subscription in subscriptions:
+            try:
+                await subscription.delete()
+            except Exception:
+                pass
+
+    @staticmethod # old receiver
+    async def opcuaReceiverConnection(container, host, data, stop, pollingRate=DEFAULT_POLLING_RATE):
+        print(f'Opcua receiver task started: {host}')
+        client = await OpcuaSessionPool.acquire(host)
+        secondsPerPoll = 1/pollingRate
+        while await client.waitConnected(stop):
+            start = time.time_ns()
+            try:
+                await Opcua.OpcuaGetData(container, data, client)
+            except:
+                pass
+            elapsed = (time.time_ns() - start)/1000000000
+            await Opcua.waitStop(stop, secondsPerPoll - elapsed)
+        await OpcuaSessionPool.release(host)
+        print(f'Opcua receiver task stopped: {host}')
     
     @staticmethod
     async def OpcuaGetData(container, data, client):
+        await client.resolveNodes(data)
         values = await asyncio.gather(*[client.getValue(d) for d in data])
         for d, v in zip(data, values):
             container.setValue(d, *v)
             # container.setValue(d, random.random(), '')
     
     @staticmethod
-    def createOpcuaTransmitterThread(container, host, stop, pollingRate=DEFAULT_POLLING_RATE):
-        t = Thread(target = Opcua.opcuaTransmitterConnection, args =(container, host, stop, pollingRate))
-        t.start()
-        return t
+    def createOpcuaTransmitterTask(container, host, stop, pollingRate=DEFAULT_POLLING_RATE, maxBatchSize=DEFAULT_WRITE_BATCH):
+        return IoLoop.submit(Opcua.opcuaTransmitterConnection(container, host, stop, pollingRate, maxBatchSize))
     
     @staticmethod
-    def opcuaTransmitterConnection(container, host, stop, pollingRate=DEFAULT_POLLING_RATE):
-
-        print(f'Opcua transmitter thread started: {host}')
-        try:
-            client = Opcua(host)
-        except:
-            print(f'Opcua transmitter thread stopping: {host}')
-            stop = lambda:True
-            return
-        start = time.time_ns()
-        nanoPerPoll = 1/pollingRate*1000000000
-        rate = 0
-        accum = 0
-        timeCounter = 0
-        while not stop():
-            current = time.time_ns()
-            time_past = current - start
-            accum += time_past
-            timeCounter += time_past
-            start = current
-            if accum >= nanoPerPoll:
-                try:
-                    for key in container.opcuaDict:
-                        if not container.hasUpdated(key): continue
-                        v,t = container.getValue(key)
-                        
-                        loop = asyncio.get_event_loop()
-                        task = loop.create_task(client.setValue(key, v, t))
-                        loop.run_until_complete(task)
-                        # asyncio.run(client.setValue(key, v, t))
-                except:
-                    print('Something went wrong sending data')
-                    continue
-                rate += 1
-                accum = 0
-            else:
-                time.sleep((nanoPerPoll - accum)/1000000000)
-            if timeCounter >= 10000000000:
-                # print(f'Opcua transmitter polling rate: {int(rate/10)}/s')
-                timeCounter -= 10000000000
-                rate = 0
-        client.stop()
-        print(f'Opcua transmitter thread stopped: {host}')
-
-
+    async def opcuaTransmitterConnection(container, host, stop, pollingRate=DEFAULT_POLLING_RATE, maxBatchSize=DEFAULT_WRITE_BATCH):
 
+        print(f'Opcua transmitter task started: {host}')
+        client = await OpcuaSessionPool.acquire(host)
+        secondsPerPoll = 1/pollingRate
+        while await client.waitConnected(stop):
+            start = time.time_ns()
+            try:
+                items = []
+                for key in list(container.opcuaDict):
+                    if not container.hasUpdated(key): continue
+                    items.append((key, *container.getValue(key)))
+                for i in range(0, len(items), maxBatchSize):
+                    await client.setValues(items[i:i+maxBatchSize])
+            except:
+                print('Something went wrong sending data')
+            elapsed = (time.time_ns() - start)/1000000000
+            await Opcua.waitStop(stop, secondsPerPoll - elapsed)
+        await OpcuaSessionPool.release(host)
+        print(f'Opcua transmitter task stopped: {host}')
 
+    @staticmethod
+    async def waitAny(*events, timeout=None):
+        waiters = [asyncio.ensure_future(e.wait()) for e in events]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters: waiter.cancel()
 
+    @staticmethod
+    async def waitStop(stop, timeout):
+        # sleeps for timeout but wakes as soon as stop is set
+        try:
+            await asyncio.wait_for(stop.wait(), max(0, timeout))
+        except asyncio.TimeoutError:
+            pass
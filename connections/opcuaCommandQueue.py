@@ -0,0 +1,125 @@
+from collections import OrderedDict, deque
+from threading import Lock
+
+import numpy as np
+import asyncio
+import time
+
+from connections.ioLoop import IoLoop
+from connections.opcua import Opcua, OpcuaContainer, OpcuaSessionPool
+from utils.debug import addProfileReport
+
+class OpcuaCommandQueue(OpcuaContainer):
+
+    # Ordered, coalescing write queue for one robot, a drop in replacement
+    # for the transmitter's OpcuaContainer. Setting a key that is still
+    # queued drops the old value and requeues the key at the back, so the
+    # server always sees keys in the order of their latest setValue.
+    # Urgent values wake the sender immediately, everything queued before
+    # them is written first and they go out in a WriteRequest of their own.
+    LATENCY_WINDOW = 256
+    QUEUES = []
+
+    def __init__(self, name=''):
+        super().__init__()
+        self.name = name
+        self.lock = Lock()
+        self.pending = OrderedDict()
+        self.inflight = set()
+        self.wake = None
+        self.sent = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=OpcuaCommandQueue.LATENCY_WINDOW)
+        OpcuaCommandQueue.QUEUES.append(self)
+
+    def setValue(self, key, value, type, urgent=False):
+        super().setValue(key, value, type)
+        with self.lock:
+            if key in self.pending:
+                del self.pending[key]
+                self.coalesced += 1
+            self.pending[key] = (key, value, type, urgent, time.time())
+        if urgent and self.wake != None:
+            IoLoop.call(self.wake.set)
+
+    def hasUpdated(self, key):
+        # True until the latest value for key has been written
+        return key in self.pending or key in self.inflight
+
+    def getQueueDepth(self):
+        return len(self.pending)
+
+    def getStats(self):
+        latencies = np.array(self.latencies)*1000
+        return {
+            'depth': len(self.pending),
+            'inflight': len(self.inflight),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'latency': tuple(np.percentile(latencies, (50, 95, 99))) if len(latencies) > 0 else None,
+        }
+
+    async def run(self, host, stop, pollingRate, maxBatchSize=Opcua.DEFAULT_WRITE_BATCH):
+        client = await OpcuaSessionPool.acquire(host)
+        print(f'Opcua command queue started: {host} {self.name}')
+        self.wake = asyncio.Event()
+        try:
+            # values wait for the next tick unless an urgent one wakes the sender
+            while await client.waitConnected(stop):
+                await Opcua.waitAny(stop, self.wake, timeout=1/pollingRate)
+                self.wake.clear()
+                await self.__flush(client, maxBatchSize)
+        finally:
+            self.wake = None
+            await OpcuaSessionPool.release(host)
+        print(f'Opcua command queue stopped: {host} {self.name}')
+
+    async def __flush(self, client, maxBatchSize):
+        with self.lock:
+            items = list(self.pending.values())
+            self.pending.clear()
+            self.inflight.update(item[0] for item in items)
+        writes = []
+        batch = []
+        for item in items:
+            if not item[3]:
+                batch.append(item)
+                continue
+            if len(batch) > 0: writes.append(batch)
+            writes.append([item])
+            batch = []
+        if len(batch) > 0: writes.append(batch)
+        writes = [w[i:i+maxBatchSize] for w in writes for i in range(0, len(w), maxBatchSize)]
+
+        for i, write in enumerate(writes):
+            try:
+                await client.setValues([(key, value, type) for key, value, type, _, _ in write])
+            except Exception:
+                print(f'Opcua command queue write failed: {self.name}')
+                self.__requeue([item for w in writes[i:] for item in w])
+                return
+            now = time.time()
+            for key, _, _, _, queued in write:
+                self.inflight.discard(key)
+                self.latencies.append(now - queued)
+            self.sent += len(write)
+
+    def __requeue(self, items):
+        # unsent items go back in front of anything queued since, unless superseded
+        with self.lock:
+            pending = OrderedDict((item[0], item) for item in items if not item[0] in self.pending)
+            pending.update(self.pending)
+            self.pending = pending
+            self.inflight.clear()
+
+    @staticmethod
+    def report():
+        queues = [q for q in OpcuaCommandQueue.QUEUES if q.sent > 0]
+        if len(queues) == 0: return
+        print(f'Command Queues (latency p50/p95/p99 ms):')
+        for q in queues:
+            stats = q.getStats()
+            latency = '/'.join(f'{v:.1f}' for v in stats['latency']) if stats['latency'] != None else '-'
+            print(f'  {q.name}: depth {stats["depth"]}, sent {stats["sent"]}, coalesced {stats["coalesced"]}, latency {latency}')
+
+addProfileReport(OpcuaCommandQueue.report)
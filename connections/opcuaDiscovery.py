@@ -0,0 +1,228 @@
+from asyncua import ua
+
+import hashlib
+import asyncio
+import json
+import re
+import os
+
+from connections.ioLoop import IoLoop
+from connections.opcua import OpcuaSessionPool
+from connections.opcuaNodeCache import OpcuaNodeCache
+
+class CatalogueRobot:
+
+    # one robot's node set, channels maps the variable name (d_Joi1, c_Start,
+    # ...) to its node id string and VariantType value
+    JOINTS = [f'd_Joi{i}' for i in range(1, 8)]
+    BASE = ['d_BaseX', 'd_BaseY', 'd_BaseA']
+
+    def __init__(self, rid, ns, namespace, channels):
+        self.rid = rid
+        self.robotId = int(rid[1:])
+        self.ns = ns
+        self.namespace = namespace
+        self.channels = channels
+
+    def hasArm(self):
+        return all(name in self.channels for name in CatalogueRobot.JOINTS)
+
+    def hasBase(self):
+        return all(name in self.channels for name in CatalogueRobot.BASE)
+
+    def hasForce(self):
+        return 'd_ForX' in self.channels
+
+    def toDict(self):
+        return {'rid': self.rid, 'ns': self.ns, 'namespace': self.namespace, 'channels': self.channels}
+
+    @staticmethod
+    def fromDict(d):
+        return CatalogueRobot(d['rid'], d['ns'], d['namespace'], d['channels'])
+
+class RobotCatalogue:
+
+    # Robots found by browsing the server's address space for node sets
+    # named R<n>d_Joi*/R<n>d_Base*. The catalogue is cached per host together
+    # with the namespace array it was built against, a matching namespace
+    # array on the next start is taken as an unchanged address space.
+    CACHE_DIR = OpcuaNodeCache.CACHE_DIR
+    NODE_PATTERN = re.compile(r'^(R\d+)([a-z]_\w+)$')
+    ROBOT_CHANNELS = ('d_Joi', 'd_Base')
+    MAX_DEPTH = 4
+    BATCH = 500
+    CONNECT_TIMEOUT = 3
+    HOLDS = set()
+
+    def __init__(self, host, namespaces, robots):
+        self.host = host
+        self.namespaces = namespaces
+        self.robots = robots
+        self.stale = False
+
+    def getRobots(self):
+        return self.robots
+
+    def getRobot(self, rid):
+        for robot in self.robots:
+            if robot.rid == rid: return robot
+        return None
+
+    @staticmethod
+    def load(host, timeout=10, hold=False):
+        # blocking, returns the cached catalogue marked stale if the server
+        # can not be reached and None if there is no cache either. With hold
+        # the pooled session stays open after discovery until releaseHold.
+        if hold: RobotCatalogue.hold(host)
+        try:
+            return IoLoop.submit(RobotCatalogue.discover(host)).result(timeout)
+        except Exception as e:
+            print(f'Robot discovery failed: {host} {e}')
+        return RobotCatalogue.loadCached(host)
+
+    @staticmethod
+    def hold(host):
+        # keeps the host's pooled session open so receivers started after
+        # discovery reuse its connection instead of opening a new one
+        if host in RobotCatalogue.HOLDS: return
+        RobotCatalogue.HOLDS.add(host)
+        IoLoop.submit(OpcuaSessionPool.acquire(host)).result()
+
+    @staticmethod
+    def releaseHold(host):
+        # call once the receivers have been started, their acquire runs on
+        # the io loop before this release does
+        if not host in RobotCatalogue.HOLDS: return
+        RobotCatalogue.HOLDS.discard(host)
+        IoLoop.submit(OpcuaSessionPool.release(host))
+
+    @staticmethod
+    def loadCached(host):
+        # the last discovered catalogue without asking the server, marked stale
+        catalogue = RobotCatalogue.__loadCache(host)
+        if catalogue != None: catalogue.stale = True
+        return catalogue
+
+    @staticmethod
+    async def discover(host):
+        session = await OpcuaSessionPool.acquire(host)
+        try:
+            await asyncio.wait_for(session.connected.wait(), RobotCatalogue.CONNECT_TIMEOUT)
+            client = session.opcuaClient
+            namespaces = await client.get_namespace_array()
+            catalogue = RobotCatalogue.__loadCache(host)
+            if catalogue != None and catalogue.namespaces == namespaces:
+                return catalogue
+            print(f'Browsing address space: {host}')
+            catalogue = RobotCatalogue(host, namespaces, await RobotCatalogue.__browse(client, namespaces))
+            catalogue.__saveCache()
+            # the catalogue already knows every type, seed the node cache with them
+            for robot in catalogue.robots:
+                for nodeid, vtype in robot.channels.values():
+                    session.nodeCache.types[nodeid] = ua.VariantType(vtype)
+            session.nodeCache.save()
+            return catalogue
+        finally:
+            await OpcuaSessionPool.release(host)
+
+    @staticmethod
+    async def __browse(client, namespaces):
+        robots = {}
+        for nodeid in await RobotCatalogue.__browseVariables(client):
+            if not isinstance(nodeid.Identifier, str): continue
+            match = RobotCatalogue.NODE_PATTERN.match(nodeid.Identifier)
+            if match == None: continue
+            rid, name = match.groups()
+            robots.setdefault((nodeid.NamespaceIndex, rid), {})[name] = nodeid
+        found = []
+        for (ns, rid), channels in sorted(robots.items(), key=lambda r: int(r[0][1][1:])):
+            if not any(name.startswith(RobotCatalogue.ROBOT_CHANNELS) for name in channels): continue
+            names = list(channels)
+            types = await RobotCatalogue.__readTypes(client, [channels[n] for n in names])
+            channels = {n:[channels[n].to_string(), t.value] for n, t in zip(names, types)}
+            found.append(CatalogueRobot(rid, ns, namespaces[ns], channels))
+        return found
+
+    @staticmethod
+    async def __browseVariables(client):
+        # breadth first over non standard objects, one Browse call per level
+        variables = []
+        frontier = [client.nodes.objects.nodeid]
+        seen = set(frontier)
+        for _ in range(RobotCatalogue.MAX_DEPTH):
+            nextFrontier = []
+            for i in range(0, len(frontier), RobotCatalogue.BATCH):
+                for ref in await RobotCatalogue.__browseNodes(client, frontier[i:i+RobotCatalogue.BATCH]):
+                    nodeid = ua.NodeId(ref.NodeId.Identifier, ref.NodeId.NamespaceIndex)
+                    if nodeid in seen: continue
+                    seen.add(nodeid)
+                    if ref.NodeClass == ua.NodeClass.Variable:
+                        variables.append(nodeid)
+                    elif nodeid.NamespaceIndex != 0:
+                        nextFrontier.append(nodeid)
+            frontier = nextFrontier
+            if len(frontier) == 0: break
+        return variables
+
+    @staticmethod
+    async def __browseNodes(client, nodeids):
+        params = ua.BrowseParameters()
+        for nodeid in nodeids:
+            desc = ua.BrowseDescription()
+            desc.NodeId = nodeid
+            desc.BrowseDirection = ua.BrowseDirection.Forward
+            desc.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+            desc.IncludeSubtypes = True
+            desc.NodeClassMask = ua.NodeClass.Object | ua.NodeClass.Variable
+            desc.ResultMask = ua.BrowseResultMask.All
+            params.NodesToBrowse.append(desc)
+        refs = []
+        for result in await client.uaclient.browse(params):
+            refs += result.References
+            continuation = result.ContinuationPoint
+            while continuation:
+                nextParams = ua.BrowseNextParameters()
+                nextParams.ContinuationPoints = [continuation]
+                nextParams.ReleaseContinuationPoints = False
+                nextResult = (await client.uaclient.browse_next(nextParams))[0]
+                refs += nextResult.References
+                continuation = nextResult.ContinuationPoint
+        return refs
+
+    @staticmethod
+    async def __readTypes(client, nodeids):
+        params = ua.ReadParameters()
+        for nodeid in nodeids:
+            rv = ua.ReadValueId()
+            rv.NodeId = nodeid
+            rv.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(rv)
+        types = []
+        for nodeid, dv in zip(nodeids, await client.uaclient.read(params)):
+            if dv.StatusCode.is_good() and dv.Value != None and dv.Value.VariantType != ua.VariantType.Null:
+                types.append(dv.Value.VariantType)
+            else:
+                types.append(await client.get_node(nodeid).read_data_type_as_variant_type())
+        return types
+
+    @staticmethod
+    def __cachePath(host):
+        return f'{RobotCatalogue.CACHE_DIR}/catalogue-{hashlib.sha1(host.encode()).hexdigest()}.json'
+
+    @staticmethod
+    def __loadCache(host):
+        path = RobotCatalogue.__cachePath(host)
+        if not os.path.exists(path): return None
+        try:
+            cacheFile = open(path, 'r')
+            d = json.load(cacheFile)
+            cacheFile.close()
+            return RobotCatalogue(host, d['namespaces'], [CatalogueRobot.fromDict(r) for r in d['robots']])
+        except Exception:
+            return None
+
+    def __saveCache(self):
+        os.makedirs(RobotCatalogue.CACHE_DIR, exist_ok=True)
+        cacheFile = open(RobotCatalogue.__cachePath(self.host), 'w')
+        json.dump({'namespaces': self.namespaces, 'robots': [r.toDict() for r in self.robots]}, cacheFile, indent=1)
+        cacheFile.close()
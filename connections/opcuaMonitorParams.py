@@ -0,0 +1,33 @@
+from asyncua import ua
+
+class MonitorParams:
+
+    ABSOLUTE = ua.DeadbandType.Absolute
+    # percent deadbands are relative to the node's EURange property, which the
+    # server has to expose for them to be accepted
+    PERCENT = ua.DeadbandType.Percent
+
+    def __init__(self, samplingInterval=-1, queueSize=0, deadband=0, deadbandType=ABSOLUTE):
+        # samplingInterval in ms, -1 samples at the subscription's publishing
+        # interval, 0 at the fastest rate the server can manage
+        self.samplingInterval = samplingInterval
+        self.queueSize = queueSize
+        self.deadband = deadband
+        self.deadbandType = deadbandType
+
+    def createFilter(self):
+        if self.deadband <= 0: return None
+        mfilter = ua.DataChangeFilter()
+        mfilter.Trigger = ua.DataChangeTrigger.StatusValue
+        mfilter.DeadbandType = self.deadbandType
+        mfilter.DeadbandValue = self.deadband
+        return mfilter
+
+    def getKey(self):
+        return (self.samplingInterval, self.queueSize, self.deadband, self.deadbandType)
+
+    @staticmethod
+    def forKeys(keys, params):
+        return {key:params for key in keys}
+
+MonitorParams.DEFAULT = MonitorParams()
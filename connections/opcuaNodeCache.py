@@ -0,0 +1,82 @@
+from asyncua import ua
+
+import hashlib
+import pickle
+import os
+
+class OpcuaNodeCache:
+
+    CACHE_DIR = 'cache/opcua'
+
+    def __init__(self, client, host):
+        self.client = client
+        self.host = host
+        self.nodes = {}
+        self.types = {}
+        self.path = None
+
+    async def load(self):
+        # the namespace array changes whenever the server's address space
+        # layout does, so it doubles as the cache key
+        namespaces = await self.client.get_namespace_array()
+        key = hashlib.sha1('\n'.join([self.host, *namespaces]).encode()).hexdigest()
+        self.path = f'{OpcuaNodeCache.CACHE_DIR}/{key}'
+        if not os.path.exists(self.path): return
+        try:
+            cacheFile = open(self.path, 'rb')
+            self.types = {k:ua.VariantType(v) for k,v in pickle.load(cacheFile).items()}
+            cacheFile.close()
+        except Exception:
+            self.types = {}
+
+    def save(self):
+        if self.path == None: return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        cacheFile = open(self.path, 'wb')
+        pickle.dump({k:v.value for k,v in self.types.items()}, cacheFile)
+        cacheFile.close()
+
+    def setClient(self, client):
+        # registered node ids are only valid for the session that registered them
+        self.client = client
+        self.nodes = {}
+
+    def getNode(self, name):
+        if name in self.nodes: return self.nodes[name]
+        return self.client.get_node(name)
+
+    def getType(self, name):
+        return self.types.get(name, None)
+
+    async def resolve(self, names):
+        missing = [n for n in dict.fromkeys(names) if not n in self.types]
+        if len(missing) > 0:
+            await self.__readTypes(missing)
+            self.save()
+        unregistered = [n for n in dict.fromkeys(names) if not n in self.nodes]
+        if len(unregistered) > 0:
+            await self.__registerNodes(unregistered)
+        return [(self.nodes[n], self.types[n]) for n in names]
+
+    async def __readTypes(self, names):
+        params = ua.ReadParameters()
+        for name in names:
+            rv = ua.ReadValueId()
+            rv.NodeId = ua.NodeId.from_string(name)
+            rv.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(rv)
+        results = await self.client.uaclient.read(params)
+        for name, dv in zip(names, results):
+            # an empty value says nothing about the type, ask for the data type
+            if dv.StatusCode.is_good() and dv.Value != None and dv.Value.VariantType != ua.VariantType.Null:
+                self.types[name] = dv.Value.VariantType
+            else:
+                self.types[name] = await self.client.get_node(name).read_data_type_as_variant_type()
+
+    async def __registerNodes(self, names):
+        try:
+            registered = await self.client.register_nodes([self.client.get_node(n) for n in names])
+        except Exception:
+            registered = [self.client.get_node(n) for n in names]
+        for name, node in zip(names, registered):
+            self.nodes[name] = node
@@ -1,23 +1,55 @@
 from connections.opcua import *
+from connections.telemetryProcess import TelemetryProcess
+from connections.telemetryReplay import TelemetryReplay
 from utils.debug import *
 from utils.interfaces.pollController import PollController
 
 class OpcuaReceiver(PollController):
-    def __init__(self, data, container, host, pollingRate=30):
+    def __init__(self, data, container, host, pollingRate=30, monitoring=None, classes=None):
         self.data = data
         self.container = container
         self.host = host
-        self.threadStopFlag = False
-        self.thread = None
+        self.stopEvent = asyncio.Event()
+        self.task = None
+        self.replay = None
+        self.shared = None
+        self.sharedBlock = None
         self.pollingRate = pollingRate
+        # node name -> MonitorParams, unlisted nodes use MonitorParams.DEFAULT
+        self.monitoring = monitoring or {}
+        # node name -> SubscriptionClass, unlisted nodes share a subscription at pollingRate
+        self.classes = classes or {}
     
     def start(self):
-        self.threadStopFlag = False
-        if self.thread == None or not self.thread.is_alive():
-            self.thread = Opcua.createOpcuaReceiverThread(self.container, self.host, self.data, lambda:self.threadStopFlag, pollingRate=self.pollingRate)
+        self.replay = TelemetryReplay.INSTANCE
+        if self.replay != None:
+            # replaying a telemetry log stands in for the server
+            self.replay.attach(self.data, self.container)
+            return
+        self.shared = TelemetryProcess.INSTANCE
+        if self.shared != None:
+            # the subscription runs in the telemetry process, values arrive through shared memory
+            if self.sharedBlock == None:
+                self.sharedBlock = self.shared.attach(self.data, self.container, self.host, self.pollingRate, self.monitoring, self.classes)
+            return
+        if self.task == None or self.task.done():
+            self.stopEvent = asyncio.Event()
+            self.task = Opcua.createOpcuaReceiverTask(self.container, self.host, self.data, self.stopEvent, pollingRate=self.pollingRate, monitoring=self.monitoring, classes=self.classes)
 
     @timing
     def stop(self):
-        self.threadStopFlag = True
-        if self.thread:
-            self.thread.join(5)
\ No newline at end of file
+        if self.replay != None:
+            self.replay.detach(self.container)
+            self.replay = None
+            return
+        if self.shared != None:
+            self.shared.detach(self.sharedBlock)
+            self.shared = None
+            self.sharedBlock = None
+            return
+        if self.task == None: return
+        IoLoop.call(self.stopEvent.set)
+        try:
+            self.task.result(5)
+        except Exception:
+            pass
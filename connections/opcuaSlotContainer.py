@@ -0,0 +1,79 @@
+import numpy as np
+
+from connections.opcua import OpcuaContainer
+
+class SlotGroup:
+
+    # ChannelGroup over a preallocated float array. Values are staged on the
+    # io thread and committed with the container's other groups once per
+    # publish response into the back buffer, which then becomes the front.
+    # versions counts commits per slot so readers can tell what changed.
+    def __init__(self, keys, default=0):
+        self.keys = keys
+        self.values = np.full((2, len(keys)), default, dtype='float64')
+        self.versions = np.zeros((2, len(keys)), dtype='uint64')
+        self.front = 0
+        self.seq = 0
+        self.staged = {}
+
+    def stage(self, index, value):
+        # runs inside the asyncua handler, a bad value must not raise there
+        try:
+            self.staged[index] = float(value)
+        except (TypeError, ValueError):
+            pass
+
+    def commit(self):
+        if len(self.staged) == 0: return
+        staged = self.staged
+        self.staged = {}
+        back = 1-self.front
+        self.values[back] = self.values[self.front]
+        self.versions[back] = self.versions[self.front]
+        indexes = list(staged.keys())
+        self.values[back, indexes] = list(staged.values())
+        self.versions[back, indexes] += 1
+        self.front = back
+        self.seq += 1
+
+    def read(self, slots=slice(None)):
+        # (values, versions) of slots from one committed snapshot
+        while True:
+            seq = self.seq
+            front = self.front
+            values = self.values[front][slots].copy()
+            versions = self.versions[front][slots].copy()
+            if seq == self.seq: return (values, versions)
+
+class OpcuaSlotContainer(OpcuaContainer):
+
+    # node names are resolved to integer slots once, values live in a
+    # preallocated double buffered array committed with the groups so a
+    # read never mixes two publish responses
+    def __init__(self, keys, default=0):
+        super().__init__()
+        self.slots = {key:i for i, key in enumerate(keys)}
+        self.slotGroup = SlotGroup(keys, default)
+        self.groups['slots'] = self.slotGroup
+        for i, key in enumerate(keys):
+            self.keyGroups.setdefault(key, []).append((self.slotGroup, i))
+        self.seen = np.zeros(len(keys), dtype='uint64')
+
+    def getSlot(self, key):
+        return self.slots[key]
+
+    def getSlots(self, keys):
+        # contiguous keys compile to a slice so reads are views, not gathers
+        indexes = [self.slots[key] for key in keys]
+        if indexes == list(range(indexes[0], indexes[0]+len(indexes))):
+            return slice(indexes[0], indexes[0]+len(indexes))
+        return np.array(indexes)
+
+    def hasUpdatedSlots(self, slots):
+        group = self.slotGroup
+        return bool((group.versions[group.front][slots] != self.seen[slots]).any())
+
+    def getSlotValues(self, slots):
+        values, versions = self.slotGroup.read(slots)
+        self.seen[slots] = versions
+        return values
@@ -0,0 +1,162 @@
+from asyncua import ua
+
+import weakref
+import time
+
+from utils.debug import addProfileReport
+
+class AdaptiveRate:
+
+    # Publishing interval bounds of an adaptive SubscriptionClass. Activity
+    # is the share of publishing cycles in which the most active item of a
+    # subscription changed over the last WINDOW seconds, so a single moving
+    # joint is enough to keep its subscription fast. Above raiseAt the
+    # interval goes straight back to minInterval so motion is shown at full
+    # rate from the first window, below lowerAt it doubles after
+    # lowerWindows windows in a row, anything in between resets the count.
+    WINDOW = 2
+
+    def __init__(self, minInterval, maxInterval, lowerAt=0.1, raiseAt=0.5, lowerWindows=3):
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.lowerAt = lowerAt
+        self.raiseAt = raiseAt
+        self.lowerWindows = lowerWindows
+
+    def next(self, interval, activity, votes):
+        # returns (interval, votes), votes counts windows in a row asking
+        # for a slower interval
+        if activity > self.raiseAt:
+            return (self.minInterval, 0)
+        elif activity < self.lowerAt and interval < self.maxInterval:
+            votes -= 1
+            if -votes >= self.lowerWindows: return (min(self.maxInterval, interval*2), 0)
+        else:
+            votes = 0
+        return (interval, votes)
+
+class SubscriptionClass:
+
+    # Priority class of monitored items. Every receiver puts each class in a
+    # subscription of its own, so a busy low priority class only ever fills
+    # its own publish responses and the server serves higher Priority
+    # subscriptions first when it is short on publish requests.
+    KEEPALIVE_SECONDS = 10
+    RATES = {}
+    # live handlers per class name, kept off the instances so classes stay
+    # picklable for the telemetry process
+    HANDLERS = {}
+
+    def __init__(self, name, publishingInterval, maxNotifications=0, priority=0, adaptive=None):
+        # publishingInterval in ms, maxNotifications 0 is unlimited, adaptive
+        # an AdaptiveRate or None for a fixed interval
+        self.name = name
+        self.publishingInterval = publishingInterval
+        self.maxNotifications = maxNotifications
+        self.priority = priority
+        self.adaptive = adaptive
+        self.resetStats()
+
+    def createParameters(self):
+        params = ua.CreateSubscriptionParameters()
+        self.__fillParameters(params, self.publishingInterval)
+        params.PublishingEnabled = True
+        return params
+
+    def createModifyParameters(self, subscriptionId, publishingInterval):
+        params = ua.ModifySubscriptionParameters()
+        params.SubscriptionId = subscriptionId
+        self.__fillParameters(params, publishingInterval)
+        return params
+
+    def __fillParameters(self, params, publishingInterval):
+        params.RequestedPublishingInterval = publishingInterval
+        params.RequestedMaxKeepAliveCount = max(1, int(SubscriptionClass.KEEPALIVE_SECONDS*1000/publishingInterval))
+        params.RequestedLifetimeCount = max(10000, 3*params.RequestedMaxKeepAliveCount)
+        params.MaxNotificationsPerPublish = self.maxNotifications
+        params.Priority = self.priority
+
+    def createHandler(self, container):
+        handler = SubscriptionClassHandler(self, container)
+        SubscriptionClass.HANDLERS.setdefault(self.name, weakref.WeakSet()).add(handler)
+        return handler
+
+    def resetStats(self):
+        self.notifications = 0
+        self.statsStart = time.time()
+
+    def getStats(self):
+        # publishingIntervals are the current, possibly adapted, intervals
+        # of the live subscriptions of this class
+        elapsed = time.time() - self.statsStart
+        return {
+            'publishingInterval': self.publishingInterval,
+            'publishingIntervals': sorted(h.publishingInterval for h in list(SubscriptionClass.HANDLERS.get(self.name, ()))),
+            'notifications': self.notifications,
+            'rate': self.notifications/elapsed if elapsed > 0 else 0,
+        }
+
+    @staticmethod
+    def forRate(pollingRate):
+        # the class of items without a declared class, shared per rate
+        if not pollingRate in SubscriptionClass.RATES:
+            SubscriptionClass.RATES[pollingRate] = SubscriptionClass(f'{pollingRate}hz', 1000/pollingRate)
+        return SubscriptionClass.RATES[pollingRate]
+
+    @staticmethod
+    def forKeys(keys, sclass):
+        return {key:sclass for key in keys}
+
+    @staticmethod
+    def plan(keys, classes, default):
+        # {SubscriptionClass: [keys]}, keys missing from classes go to default
+        plan = {}
+        for key in keys:
+            plan.setdefault(classes.get(key, default), []).append(key)
+        return plan
+
+    @staticmethod
+    def getAllStats():
+        classes = [SubscriptionClass.MOTION, SubscriptionClass.CONTROL, SubscriptionClass.STATUS, SubscriptionClass.DIAGNOSTIC, *SubscriptionClass.RATES.values()]
+        return {c.name:c.getStats() for c in classes}
+
+    @staticmethod
+    def report():
+        stats = {name:s for name, s in SubscriptionClass.getAllStats().items() if s['notifications'] > 0}
+        if len(stats) == 0: return
+        print(f'Subscription Classes:')
+        for name, s in stats.items():
+            intervals = s['publishingIntervals'] if len(s['publishingIntervals']) > 0 else [s['publishingInterval']]
+            interval = f'{intervals[0]:.0f}ms' if intervals[0] == intervals[-1] else f'{intervals[0]:.0f}-{intervals[-1]:.0f}ms'
+            print(f'  {name}: {s["notifications"]} notifications, {s["rate"]:.1f}/s at {interval}')
+
+class SubscriptionClassHandler:
+
+    # counts notifications per class, per subscription and per item before
+    # handing them to the container
+    def __init__(self, sclass, container):
+        self.sclass = sclass
+        self.container = container
+        self.notifications = 0
+        self.itemNotifications = {}
+        self.publishingInterval = sclass.publishingInterval
+
+    def datachange_notification(self, node, value, data):
+        self.sclass.notifications += 1
+        self.notifications += 1
+        self.itemNotifications[node] = self.itemNotifications.get(node, 0) + 1
+        self.container.datachange_notification(node, value, data)
+
+    def takeMostActive(self):
+        # notifications of the busiest item since the last call
+        counts = self.itemNotifications
+        self.itemNotifications = {}
+        return max(counts.values(), default=0)
+
+SubscriptionClass.MOTION = SubscriptionClass('motion', 1000/30, priority=200, adaptive=AdaptiveRate(1000/30, 1000))
+# program control words and flags rarely change but must arrive promptly when they do, never adapted
+SubscriptionClass.CONTROL = SubscriptionClass('control', 200, priority=150)
+SubscriptionClass.STATUS = SubscriptionClass('status', 200, maxNotifications=256, priority=100, adaptive=AdaptiveRate(200, 2000))
+SubscriptionClass.DIAGNOSTIC = SubscriptionClass('diagnostic', 1000, maxNotifications=64, priority=0)
+
+addProfileReport(SubscriptionClass.report)
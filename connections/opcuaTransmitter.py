@@ -1,22 +1,33 @@
 from connections.opcua import *
+from connections.opcuaCommandQueue import OpcuaCommandQueue
+from connections.telemetryReplay import TelemetryReplay
 from utils.debug import *
 from utils.interfaces.pollController import PollController
 
 class OpcuaTransmitter(PollController):
-    def __init__(self, container, host, pollingRate=10):
+    def __init__(self, container, host, pollingRate=10, maxBatchSize=Opcua.DEFAULT_WRITE_BATCH):
         self.container = container
         self.host = host
-        self.threadStopFlag = False
-        self.thread = None
+        self.stopEvent = asyncio.Event()
+        self.task = None
         self.pollingRate = pollingRate
+        self.maxBatchSize = maxBatchSize
     
     def start(self):
-        self.threadStopFlag = False
-        if self.thread == None or not self.thread.is_alive():
-            self.thread = Opcua.createOpcuaTransmitterThread(self.container, self.host, lambda:self.threadStopFlag, pollingRate=self.pollingRate)
+        # nothing to send commands to while replaying a telemetry log
+        if TelemetryReplay.INSTANCE != None: return
+        if self.task == None or self.task.done():
+            self.stopEvent = asyncio.Event()
+            if isinstance(self.container, OpcuaCommandQueue):
+                self.task = IoLoop.submit(self.container.run(self.host, self.stopEvent, self.pollingRate, self.maxBatchSize))
+            else:
+                self.task = Opcua.createOpcuaTransmitterTask(self.container, self.host, self.stopEvent, pollingRate=self.pollingRate, maxBatchSize=self.maxBatchSize)
 
     @timing
     def stop(self):
-        self.threadStopFlag = True
-        if self.thread:
-            self.thread.join(5)
\ No newline at end of file
+        if self.task == None: return
+        IoLoop.call(self.stopEvent.set)
+        try:
+            self.task.result(5)
+        except Exception:
+            pass
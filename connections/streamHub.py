@@ -0,0 +1,119 @@
+import OpenGL.GL as GL
+
+from connections.frameDecoder import FrameQueue
+from connections.mjpegThread import StreamContainer, createMjpegThread
+from connections.telemetryDispatcher import TelemetryDispatcher
+from utils.streamingTexture import StreamingTexture
+from utils.debug import addProfileReport
+
+class SharedStream:
+
+    # One url's connection, decoder and texture, shared by everything
+    # showing that camera. The connection runs while at least one subscriber
+    # is started, frames are decoded at the largest size any subscriber
+    # shows them at and uploaded once per frame by whichever subscriber
+    # updates first.
+    def __init__(self, url, size=1, policy=FrameQueue.LATEST):
+        self.url = url
+        self.container = StreamContainer(size, policy)
+        self.streamTexture = StreamingTexture()
+        self.texture = self.streamTexture.texture
+        self.subscribers = {}
+        self.running = set()
+        self.threadStopFlag = True
+        self.thread = None
+        self.lastUpdate = None
+
+    def subscribe(self, subscriber, targetSize=None):
+        self.setTargetSize(subscriber, targetSize)
+
+    def unsubscribe(self, subscriber):
+        self.stop(subscriber)
+        self.subscribers.pop(subscriber, None)
+        self.__updateTargetSize()
+
+    def setTargetSize(self, subscriber, size):
+        # (width, height) in pixels, None for full size
+        if size != None and (size[0] <= 0 or size[1] <= 0): size = None
+        self.subscribers[subscriber] = size
+        self.__updateTargetSize()
+
+    def __updateTargetSize(self):
+        sizes = list(self.subscribers.values())
+        if len(sizes) == 0 or None in sizes:
+            self.container.setTargetSize(None)
+        else:
+            self.container.setTargetSize((max(s[0] for s in sizes), max(s[1] for s in sizes)))
+
+    def update(self):
+        # returns True if a new frame was uploaded, only the first call of
+        # a render frame takes a frame off the queue
+        frame = TelemetryDispatcher.FRAME
+        if frame == self.lastUpdate: return False
+        self.lastUpdate = frame
+        frame = self.container.getFrame()
+        if frame == None: return False
+        self.streamTexture.upload(frame.width, frame.height, frame.pixels, GL.GL_RGB)
+        return True
+
+    def getStats(self):
+        stats = self.container.getStats()
+        stats['subscribers'] = len(self.subscribers)
+        stats['running'] = len(self.running)
+        return stats
+
+    def start(self, subscriber):
+        self.running.add(subscriber)
+        self.threadStopFlag = False
+        if self.thread != None and self.thread.is_alive(): return
+        self.thread = createMjpegThread(self.container, self.url, lambda:self.threadStopFlag)
+
+    def stop(self, subscriber):
+        self.running.discard(subscriber)
+        if len(self.running) == 0: self.threadStopFlag = True
+
+    def close(self):
+        self.running.clear()
+        self.threadStopFlag = True
+        self.streamTexture.delete()
+
+class StreamHub:
+
+    # process wide SharedStream per url, render thread only. New streams
+    # queue QUEUE_SIZE frames with QUEUE_POLICY.
+    STREAMS = {}
+    QUEUE_SIZE = 1
+    QUEUE_POLICY = FrameQueue.LATEST
+
+    @staticmethod
+    def subscribe(url, subscriber, targetSize=None):
+        if not url in StreamHub.STREAMS:
+            StreamHub.STREAMS[url] = SharedStream(url, StreamHub.QUEUE_SIZE, StreamHub.QUEUE_POLICY)
+        stream = StreamHub.STREAMS[url]
+        stream.subscribe(subscriber, targetSize)
+        return stream
+
+    @staticmethod
+    def unsubscribe(url, subscriber):
+        # the connection stops and the texture is freed with the last subscriber
+        stream = StreamHub.STREAMS.get(url)
+        if stream == None: return
+        stream.unsubscribe(subscriber)
+        if len(stream.subscribers) > 0: return
+        del StreamHub.STREAMS[url]
+        stream.close()
+
+    @staticmethod
+    def getStats():
+        return {url:s.getStats() for url, s in StreamHub.STREAMS.items()}
+
+    @staticmethod
+    def report():
+        stats = {url:s for url, s in StreamHub.getStats().items() if s['received'] > 0}
+        if len(stats) == 0: return
+        print(f'Streams (age p50/p95/p99 ms):')
+        for url, s in stats.items():
+            age = '/'.join(f'{v:.1f}' for v in s['age']) if s['age'] != None else '-'
+            print(f'  {url}: {s["fps"]:.1f}fps, received {s["received"]}, decoded {s["decoded"]}, dropped {s["dropped"]}, displayed {s["displayed"]}, age {age}')
+
+addProfileReport(StreamHub.report)
@@ -0,0 +1,48 @@
+from collections import deque
+from threading import Lock
+
+from utils.debug import *
+
+class TelemetryDispatcher:
+
+    # callbacks are queued from the io thread when their channels change
+    # and run on the render thread once per frame, at most once each
+    PENDING = deque()
+    # frames drained so far, telemetry is stamped with it on arrival
+    FRAME = 0
+    # called at the start of every drain, for telemetry that is pulled rather than pushed
+    POLLERS = []
+    QUEUED = set()
+    LOCK = Lock()
+
+    @staticmethod
+    def notify(callback):
+        with TelemetryDispatcher.LOCK:
+            if callback in TelemetryDispatcher.QUEUED: return
+            TelemetryDispatcher.QUEUED.add(callback)
+        TelemetryDispatcher.PENDING.append(callback)
+
+    @staticmethod
+    @funcProfiler(ftype='telemetrydispatch')
+    def drain():
+        TelemetryDispatcher.FRAME += 1
+        for poller in TelemetryDispatcher.POLLERS:
+            poller()
+        for _ in range(len(TelemetryDispatcher.PENDING)):
+            callback = TelemetryDispatcher.PENDING.popleft()
+            with TelemetryDispatcher.LOCK:
+                TelemetryDispatcher.QUEUED.discard(callback)
+            callback()
+
+    @staticmethod
+    def addPoller(poller):
+        TelemetryDispatcher.POLLERS.append(poller)
+
+    @staticmethod
+    def removePoller(poller):
+        if poller in TelemetryDispatcher.POLLERS:
+            TelemetryDispatcher.POLLERS.remove(poller)
+
+    @staticmethod
+    def getQueueDepth():
+        return len(TelemetryDispatcher.PENDING)
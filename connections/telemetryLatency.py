@@ -0,0 +1,71 @@
+from threading import Lock
+from colorama import Fore, Style
+
+import numpy as np
+
+from utils.debug import addProfileReport
+
+class TelemetryLatency:
+
+    # Rolling latency window for one channel group. Per consumed value:
+    #   network  source timestamp -> client receive, includes the server's
+    #            sampling and publishing interval and any clock offset
+    #   handoff  client receive -> consumed on the render thread
+    #   total    source timestamp -> consumed
+    #   frames   frames between receive and consume
+    WINDOW = 4096
+    STAGES = ['network', 'handoff', 'total', 'frames']
+    PERCENTILES = (50, 95, 99)
+
+    GROUPS = {}
+    LOCK = Lock()
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = np.zeros((len(TelemetryLatency.STAGES), TelemetryLatency.WINDOW))
+        self.count = 0
+
+    @staticmethod
+    def get(name):
+        with TelemetryLatency.LOCK:
+            if not name in TelemetryLatency.GROUPS:
+                TelemetryLatency.GROUPS[name] = TelemetryLatency(name)
+            return TelemetryLatency.GROUPS[name]
+
+    def record(self, source, received, receivedFrame, consumed, consumedFrame):
+        i = self.count % TelemetryLatency.WINDOW
+        self.samples[:, i] = (received - source, consumed - received, consumed - source, consumedFrame - receivedFrame)
+        self.count += 1
+
+    def getPercentiles(self):
+        # {stage: (p50, p95, p99)}, times in ms, None before the first sample
+        n = min(self.count, TelemetryLatency.WINDOW)
+        if n == 0: return None
+        samples = self.samples[:, :n].copy()
+        samples[:3] *= 1000
+        values = np.nanpercentile(samples, TelemetryLatency.PERCENTILES, axis=1)
+        return {stage:tuple(values[:, i]) for i, stage in enumerate(TelemetryLatency.STAGES)}
+
+    def getCount(self):
+        return self.count
+
+    def reset(self):
+        self.count = 0
+
+    @staticmethod
+    def getReport():
+        with TelemetryLatency.LOCK:
+            groups = list(TelemetryLatency.GROUPS.values())
+        return {group.name:group.getPercentiles() for group in groups if group.count > 0}
+
+    @staticmethod
+    def report():
+        report = TelemetryLatency.getReport()
+        if len(report) == 0: return
+        lname = max(len(name) for name in report)
+        print(f'Telemetry Latency (p50/p95/p99):')
+        for name, stages in sorted(report.items()):
+            line = '  '.join(f'{stage} {Fore.BLUE}{"/".join(f"{v:.1f}" for v in stages[stage])}{Style.RESET_ALL}' for stage in TelemetryLatency.STAGES)
+            print(f'  {name}: {" "*(lname-len(name))}{line}')
+
+addProfileReport(TelemetryLatency.report)
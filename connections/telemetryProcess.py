@@ -0,0 +1,219 @@
+from asyncua import ua
+from multiprocessing import shared_memory
+
+import multiprocessing
+import asyncio
+import pickle
+import queue
+import time
+
+import numpy as np
+
+from connections.opcua import Opcua, OpcuaContainer
+from connections.telemetryDispatcher import TelemetryDispatcher
+from connections.telemetryRecorder import TelemetryRecorder
+
+class SharedTelemetryBlock:
+
+    # One receiver's channels in shared memory behind a seqlock. The writer
+    # makes seq odd, writes, then makes it even again; a reader copies the
+    # arrays between two reads of the same even seq. versions counts updates
+    # per channel so readers can tell which channels changed.
+    #   u8 seq | f8 values[n] | f8 source[n] | f8 received[n] | u8 versions[n] | i4 types[n]
+    READ_ATTEMPTS = 8
+
+    def __init__(self, keys, name=None):
+        self.keys = keys
+        n = len(keys)
+        size = 8 + n*(8*4 + 4)
+        if name == None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = SharedTelemetryBlock.__attach(name)
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self.seq = np.ndarray(1, 'u8', buf, 0)
+        self.values = np.ndarray(n, 'f8', buf, 8)
+        self.source = np.ndarray(n, 'f8', buf, 8 + 8*n)
+        self.received = np.ndarray(n, 'f8', buf, 8 + 16*n)
+        self.versions = np.ndarray(n, 'u8', buf, 8 + 24*n)
+        self.types = np.ndarray(n, 'i4', buf, 8 + 32*n)
+        if name == None:
+            self.seq[0] = 0
+            self.versions[:] = 0
+        self.lastSeq = 0
+        self.lastVersions = np.zeros(n, 'u8')
+
+    @staticmethod
+    def __attach(name):
+        # only the creating process may unlink the block, keep the
+        # resource tracker of the attaching process out of it
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            return shared_memory.SharedMemory(name=name)
+
+    def write(self, updates):
+        # updates is a list of (slot, value, type, source, received)
+        self.seq[0] += 1
+        for slot, value, vtype, source, received in updates:
+            self.values[slot] = value
+            self.types[slot] = vtype
+            self.source[slot] = source
+            self.received[slot] = received
+            self.versions[slot] += 1
+        self.seq[0] += 1
+
+    def read(self):
+        # returns [(key, value, type, source, received)] changed since the
+        # last read, never waits on the writer, a torn read is retried next frame
+        for _ in range(SharedTelemetryBlock.READ_ATTEMPTS):
+            seq = int(self.seq[0])
+            if seq == self.lastSeq: return []
+            if seq & 1: continue
+            values = self.values.copy()
+            source = self.source.copy()
+            received = self.received.copy()
+            versions = self.versions.copy()
+            types = self.types.copy()
+            if int(self.seq[0]) != seq: continue
+            self.lastSeq = seq
+            changed = np.nonzero(versions != self.lastVersions)[0]
+            self.lastVersions = versions
+            return [(self.keys[i], values[i], types[i], source[i], received[i]) for i in changed]
+        return []
+
+    def close(self, unlink=False):
+        # the numpy views hold the buffer, drop them before closing
+        self.seq = self.values = self.source = self.received = self.versions = self.types = None
+        self.shm.close()
+        if unlink: self.shm.unlink()
+
+class SharedTelemetryWriter(OpcuaContainer):
+
+    # stands in for the render process' container inside the telemetry
+    # process, each publish response is written as one seqlock update
+    def __init__(self, block):
+        super().__init__()
+        self.block = block
+        self.slots = {key:i for i, key in enumerate(block.keys)}
+        self.pending = []
+
+    def setValue(self, key, value, type):
+        super().setValue(key, value, type)
+        if not key in self.slots: return
+        stamp = self.stamps.get(key, (np.nan, time.time()))
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return
+        if len(self.pending) == 0:
+            asyncio.get_running_loop().call_soon(self.__flush)
+        self.pending.append((self.slots[key], value, type.value if type != None else 0, stamp[0], stamp[1]))
+
+    def __flush(self):
+        if self.block.seq is None: return
+        pending = self.pending
+        self.pending = []
+        self.block.write(pending)
+
+class TelemetryProcess:
+
+    # Runs every OpcuaReceiver's subscription in a separate process so
+    # notification handling and asyncua's decoding never hold the render
+    # process' GIL. Receivers attach a SharedTelemetryBlock each, the render
+    # process reads changed blocks once per frame from TelemetryDispatcher.drain
+    # and applies them to the receiver's container. Data changes arrive in
+    # the telemetry process, so that is where a recordPath is recorded to.
+    INSTANCE = None
+
+    def __init__(self, recordPath=None):
+        context = multiprocessing.get_context('spawn')
+        self.commands = context.Queue()
+        self.process = context.Process(target=telemetryProcessMain, args=(self.commands, Opcua.HISTORY_BACKFILL, recordPath), name='TelemetryProcess', daemon=True)
+        self.process.start()
+        self.blocks = {}
+        TelemetryDispatcher.addPoller(self.poll)
+
+    @staticmethod
+    def start(recordPath=None):
+        if TelemetryProcess.INSTANCE == None:
+            TelemetryProcess.INSTANCE = TelemetryProcess(recordPath)
+        return TelemetryProcess.INSTANCE
+
+    @staticmethod
+    def stop(timeout=5):
+        instance = TelemetryProcess.INSTANCE
+        TelemetryProcess.INSTANCE = None
+        if instance == None: return
+        instance.close(timeout)
+
+    def close(self, timeout=5):
+        TelemetryDispatcher.removePoller(self.poll)
+        self.commands.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive(): self.process.terminate()
+        for block, _ in self.blocks.values():
+            block.close(unlink=True)
+        self.blocks = {}
+
+    def attach(self, data, container, host, pollingRate, monitoring, classes):
+        block = SharedTelemetryBlock(data)
+        command = ('attach', block.name, data, host, pollingRate, monitoring, classes)
+        # the queue's feeder thread drops commands it can not pickle without
+        # telling anyone, pickle here so that fails in the caller instead
+        try:
+            pickle.dumps(command)
+        except Exception:
+            block.close(unlink=True)
+            raise
+        self.blocks[block.name] = (block, container)
+        self.commands.put(command)
+        return block.name
+
+    def detach(self, name):
+        if not name in self.blocks: return
+        self.commands.put(('detach', name))
+        block, _ = self.blocks.pop(name)
+        block.close(unlink=True)
+
+    def poll(self):
+        # render thread, before the dispatcher runs this frame's listeners
+        frame = TelemetryDispatcher.FRAME
+        for block, container in list(self.blocks.values()):
+            for key, value, vtype, source, received in block.read():
+                container.stamps[key] = [source, received, frame, None]
+                container.setValue(key, value, ua.VariantType(vtype) if vtype != 0 else None)
+
+def telemetryProcessMain(commands, historyBackfill, recordPath):
+    # entry point of the telemetry process
+    from connections.ioLoop import IoLoop
+    from connections.opcuaReceiver import OpcuaReceiver
+
+    Opcua.HISTORY_BACKFILL = historyBackfill
+    if recordPath != None:
+        TelemetryRecorder.start(recordPath)
+
+    receivers = {}
+    parent = multiprocessing.parent_process()
+    while parent == None or parent.is_alive():
+        try:
+            command = commands.get(timeout=1)
+        except queue.Empty:
+            continue
+        if command == None: break
+        if command[0] == 'attach':
+            _, name, data, host, pollingRate, monitoring, classes = command
+            block = SharedTelemetryBlock(data, name)
+            receiver = OpcuaReceiver(data, SharedTelemetryWriter(block), host, pollingRate=pollingRate, monitoring=monitoring, classes=classes)
+            receiver.start()
+            receivers[name] = (receiver, block)
+        elif command[0] == 'detach' and command[1] in receivers:
+            receiver, block = receivers.pop(command[1])
+            receiver.stop()
+            block.close()
+    for receiver, block in receivers.values():
+        receiver.stop()
+        block.close()
+    TelemetryRecorder.stop()
+    IoLoop.shutdown()
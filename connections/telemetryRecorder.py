@@ -0,0 +1,249 @@
+from collections import deque
+from datetime import timezone
+from threading import Thread, Event, Lock
+
+import numpy as np
+import json
+import time
+import os
+
+def toEpoch(stamp):
+    # older asyncua versions hand out naive utc datetimes
+    if stamp == None: return np.nan
+    if stamp.tzinfo == None: stamp = stamp.replace(tzinfo=timezone.utc)
+    return stamp.timestamp()
+
+class TelemetryRecorder:
+
+    # Append only columnar log of every data change. A log directory holds
+    # channels.json (key -> channel id) and numbered segment directories, each
+    # with one raw little endian file per column and an index.bin of
+    # INDEX_DTYPE rows, one per channel per flushed batch, covering the rows
+    # and time span of that channel in the batch.
+    COLUMNS = [
+        ('channel', '<u2'),
+        ('time', '<f8'),
+        ('source', '<f8'),
+        ('server', '<f8'),
+        ('received', '<f8'),
+        ('value', '<f8'),
+    ]
+    INDEX_DTYPE = np.dtype([
+        ('channel', '<u2'),
+        ('rowStart', '<u8'),
+        ('rowEnd', '<u8'),
+        ('tMin', '<f8'),
+        ('tMax', '<f8'),
+    ])
+    CHANNELS_FILE = 'channels.json'
+    INDEX_FILE = 'index.bin'
+
+    INSTANCE = None
+    LOCK = Lock()
+
+    def __init__(self, path, flushInterval=0.5, segmentRows=1<<22):
+        self.path = path
+        self.flushInterval = flushInterval
+        self.segmentRows = segmentRows
+        self.pending = deque()
+        self.channels = {}
+        self.segment = -1
+        self.segmentFiles = {}
+        self.rows = 0
+        self.recorded = 0
+        self.stopEvent = Event()
+
+        os.makedirs(self.path, exist_ok=True)
+        self.__loadChannels()
+        self.__openSegment()
+        self.thread = Thread(target=self.__run, name='TelemetryRecorder', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def start(path, **kwargs):
+        with TelemetryRecorder.LOCK:
+            if TelemetryRecorder.INSTANCE == None:
+                TelemetryRecorder.INSTANCE = TelemetryRecorder(path, **kwargs)
+            return TelemetryRecorder.INSTANCE
+
+    @staticmethod
+    def stop(timeout=5):
+        with TelemetryRecorder.LOCK:
+            instance = TelemetryRecorder.INSTANCE
+            TelemetryRecorder.INSTANCE = None
+        if instance == None: return
+        instance.close(timeout)
+
+    def record(self, key, value, sourceTime=None, serverTime=None, received=None):
+        # called on the io thread, conversion happens on the flush thread
+        self.pending.append((key, value, sourceTime, serverTime, received or time.time()))
+
+    def close(self, timeout=5):
+        self.stopEvent.set()
+        self.thread.join(timeout)
+        for f in self.segmentFiles.values(): f.close()
+        self.segmentFiles = {}
+
+    def getStats(self):
+        return {'recorded': self.recorded, 'pending': len(self.pending), 'segment': self.segment, 'channels': len(self.channels)}
+
+    def __run(self):
+        while not self.stopEvent.wait(self.flushInterval):
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        count = len(self.pending)
+        if count == 0: return
+        batch = [self.pending.popleft() for _ in range(count)]
+        while len(batch) > 0:
+            room = self.segmentRows - self.rows
+            if room <= 0:
+                self.__openSegment()
+                continue
+            self.__write(batch[:room])
+            batch = batch[room:]
+
+    def __write(self, batch):
+        count = len(batch)
+        columns = {name:np.empty(count, dtype) for name, dtype in TelemetryRecorder.COLUMNS}
+        for i, (key, value, sourceTime, serverTime, received) in enumerate(batch):
+            columns['channel'][i] = self.__getChannel(key)
+            columns['source'][i] = toEpoch(sourceTime)
+            columns['server'][i] = toEpoch(serverTime)
+            columns['received'][i] = received
+            try:
+                columns['value'][i] = value
+            except (TypeError, ValueError):
+                columns['value'][i] = np.nan
+        # time is what the index covers, the best timestamp available per row
+        columns['time'][:] = np.where(np.isnan(columns['source']), columns['server'], columns['source'])
+        columns['time'][:] = np.where(np.isnan(columns['time']), columns['received'], columns['time'])
+
+        for name, _ in TelemetryRecorder.COLUMNS:
+            self.segmentFiles[name].write(columns[name].tobytes())
+        self.segmentFiles[TelemetryRecorder.INDEX_FILE].write(self.__index(columns['channel'], columns['time']).tobytes())
+        for f in self.segmentFiles.values(): f.flush()
+        self.rows += count
+        self.recorded += count
+
+    def __index(self, channels, times):
+        order = np.argsort(channels, kind='stable')
+        ids, starts = np.unique(channels[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        index = np.empty(len(ids), TelemetryRecorder.INDEX_DTYPE)
+        for i, (cid, start, end) in enumerate(zip(ids, starts, ends)):
+            rows = order[start:end]
+            index[i] = (cid, self.rows + rows[0], self.rows + rows[-1] + 1, times[rows].min(), times[rows].max())
+        return index
+
+    def __getChannel(self, key):
+        if key in self.channels: return self.channels[key]
+        self.channels[key] = len(self.channels)
+        channelFile = open(f'{self.path}/{TelemetryRecorder.CHANNELS_FILE}', 'w')
+        json.dump(self.channels, channelFile)
+        channelFile.close()
+        return self.channels[key]
+
+    def __loadChannels(self):
+        channelPath = f'{self.path}/{TelemetryRecorder.CHANNELS_FILE}'
+        if not os.path.exists(channelPath): return
+        channelFile = open(channelPath, 'r')
+        self.channels = json.load(channelFile)
+        channelFile.close()
+
+    def __openSegment(self):
+        # a new recorder on an existing log never appends to old segments
+        for f in self.segmentFiles.values(): f.close()
+        existing = TelemetryLog.listSegments(self.path)
+        self.segment = max(self.segment, existing[-1] if len(existing) > 0 else -1) + 1
+        segmentPath = TelemetryLog.segmentPath(self.path, self.segment)
+        os.makedirs(segmentPath, exist_ok=True)
+        names = [name for name, _ in TelemetryRecorder.COLUMNS] + [TelemetryRecorder.INDEX_FILE]
+        self.segmentFiles = {name:open(f'{segmentPath}/{name}', 'ab') for name in names}
+        self.rows = 0
+
+class TelemetryLog:
+
+    # read side of a TelemetryRecorder log, columns are memory mapped
+    def __init__(self, path):
+        self.path = path
+        self.reload()
+
+    def reload(self):
+        channelFile = open(f'{self.path}/{TelemetryRecorder.CHANNELS_FILE}', 'r')
+        self.channels = json.load(channelFile)
+        channelFile.close()
+        self.names = {cid:key for key, cid in self.channels.items()}
+        self.segments = [self.__loadSegment(s) for s in TelemetryLog.listSegments(self.path)]
+
+    @staticmethod
+    def listSegments(path):
+        if not os.path.isdir(path): return []
+        return sorted(int(d) for d in os.listdir(path) if d.isdigit())
+
+    @staticmethod
+    def segmentPath(path, segment):
+        return f'{path}/{segment:06d}'
+
+    def __loadSegment(self, segment):
+        segmentPath = TelemetryLog.segmentPath(self.path, segment)
+        columns = {name:TelemetryLog.__map(f'{segmentPath}/{name}', dtype) for name, dtype in TelemetryRecorder.COLUMNS}
+        # a crash mid flush can leave columns of different lengths
+        rows = min(len(c) for c in columns.values())
+        columns = {name:c[:rows] for name, c in columns.items()}
+        index = TelemetryLog.__map(f'{segmentPath}/{TelemetryRecorder.INDEX_FILE}', TelemetryRecorder.INDEX_DTYPE)
+        index = index[index['rowEnd'] <= rows]
+        return (columns, index)
+
+    @staticmethod
+    def __map(path, dtype):
+        dtype = np.dtype(dtype)
+        if not os.path.exists(path): return np.empty(0, dtype)
+        count = os.path.getsize(path)//dtype.itemsize
+        if count == 0: return np.empty(0, dtype)
+        return np.memmap(path, dtype, mode='r', shape=(count,))
+
+    def getChannels(self):
+        return list(self.channels)
+
+    def getTimeRange(self):
+        mins = [index['tMin'].min() for _, index in self.segments if len(index) > 0]
+        maxs = [index['tMax'].max() for _, index in self.segments if len(index) > 0]
+        if len(mins) == 0: return (None, None)
+        return (min(mins), max(maxs))
+
+    def read(self, keys=None, start=None, end=None):
+        # returns a structured array of COLUMNS rows sorted by time, for
+        # the given keys (all if None) and start <= time <= end
+        start = -np.inf if start == None else start
+        end = np.inf if end == None else end
+        ids = None if keys == None else np.array([self.channels[k] for k in keys if k in self.channels], '<u2')
+        dtype = np.dtype(TelemetryRecorder.COLUMNS)
+        parts = []
+        for columns, index in self.segments:
+            hits = (index['tMax'] >= start) & (index['tMin'] <= end)
+            if keys != None: hits &= np.isin(index['channel'], ids)
+            for rowStart, rowEnd in TelemetryLog.__mergeRanges(index[hits]):
+                rows = np.empty(rowEnd - rowStart, dtype)
+                for name, _ in TelemetryRecorder.COLUMNS:
+                    rows[name] = columns[name][rowStart:rowEnd]
+                mask = (rows['time'] >= start) & (rows['time'] <= end)
+                if keys != None: mask &= np.isin(rows['channel'], ids)
+                parts.append(rows[mask])
+        if len(parts) == 0: return np.empty(0, dtype)
+        rows = np.concatenate(parts)
+        return rows[np.argsort(rows['time'], kind='stable')]
+
+    @staticmethod
+    def __mergeRanges(index):
+        ranges = []
+        for rowStart, rowEnd in sorted(zip(index['rowStart'], index['rowEnd'])):
+            if len(ranges) > 0 and rowStart <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], rowEnd)
+            else:
+                ranges.append([rowStart, rowEnd])
+        return ranges
+
+    def getKey(self, channel):
+        return self.names[int(channel)]
@@ -0,0 +1,160 @@
+from asyncua import ua
+from threading import Thread, Event, Lock
+
+import numpy as np
+import time
+
+from connections.ioLoop import IoLoop
+from connections.telemetryRecorder import TelemetryLog
+
+class TelemetryReplay:
+
+    # Plays a TelemetryRecorder log back into the containers OpcuaReceivers
+    # attach while it is running, through the io loop so group snapshots and
+    # listeners behave exactly as with a live subscription.
+    # speed is log seconds per wall second, 0 plays as fast as possible.
+    CHUNK_SECONDS = 5
+    TICK_RATE = 240
+    MAX_BATCH = 4096
+
+    INSTANCE = None
+    LOCK = Lock()
+
+    def __init__(self, path, speed=1, loop=False):
+        self.log = TelemetryLog(path)
+        self.speed = speed
+        self.loop = loop
+        self.logStart, self.logEnd = self.log.getTimeRange()
+        if self.logStart == None: self.logStart, self.logEnd = (0, 0)
+        self.keys = {}
+        self.lock = Lock()
+        self.stopEvent = Event()
+        self.playing = Event()
+        self.finished = False
+        self.delivered = 0
+        self.__seek(self.logStart)
+        self.thread = Thread(target=self.__run, name='TelemetryReplay', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def start(path, **kwargs):
+        with TelemetryReplay.LOCK:
+            if TelemetryReplay.INSTANCE == None:
+                TelemetryReplay.INSTANCE = TelemetryReplay(path, **kwargs)
+            return TelemetryReplay.INSTANCE
+
+    @staticmethod
+    def stop(timeout=5):
+        with TelemetryReplay.LOCK:
+            instance = TelemetryReplay.INSTANCE
+            TelemetryReplay.INSTANCE = None
+        if instance == None: return
+        instance.close(timeout)
+
+    def close(self, timeout=5):
+        self.stopEvent.set()
+        self.playing.set()
+        self.thread.join(timeout)
+
+    def attach(self, keys, container):
+        # the clock starts with the first attached container
+        with self.lock:
+            for key in keys:
+                self.keys.setdefault(key, []).append(container)
+            if not self.playing.is_set(): self.resume()
+
+    def detach(self, container):
+        with self.lock:
+            for containers in self.keys.values():
+                if container in containers: containers.remove(container)
+
+    def seek(self, position):
+        with self.lock:
+            self.__seek(min(max(position, self.logStart), self.logEnd))
+
+    def setSpeed(self, speed):
+        with self.lock:
+            position = self.getPosition()
+            self.speed = speed
+            self.__anchor(position)
+
+    def pause(self):
+        with self.lock:
+            self.position = self.getPosition()
+            self.playing.clear()
+
+    def resume(self):
+        self.__anchor(self.position)
+        self.playing.set()
+
+    def getPosition(self):
+        # log time of the last delivered row when paused or running flat out
+        if not self.playing.is_set() or self.speed <= 0: return self.position
+        return self.anchorLog + (time.time() - self.anchorWall)*self.speed
+
+    def getTimeRange(self):
+        return (self.logStart, self.logEnd)
+
+    def getStats(self):
+        return {'position': self.getPosition(), 'delivered': self.delivered, 'finished': self.finished, 'speed': self.speed}
+
+    def __anchor(self, position):
+        self.anchorLog = position
+        self.anchorWall = time.time()
+
+    def __seek(self, position):
+        self.position = position
+        self.chunk = self.log.read(start=position, end=position + TelemetryReplay.CHUNK_SECONDS)
+        self.chunkEnd = position + TelemetryReplay.CHUNK_SECONDS
+        self.offset = 0
+        self.finished = False
+        self.__anchor(position)
+
+    def __take(self, target):
+        # rows with time <= target, at most MAX_BATCH, loading chunks as needed
+        while True:
+            if self.offset < len(self.chunk):
+                stop = np.searchsorted(self.chunk['time'], target, 'right')
+                stop = min(stop, self.offset + TelemetryReplay.MAX_BATCH)
+                rows = self.chunk[self.offset:stop]
+                self.offset = stop
+                return rows
+            if self.chunkEnd >= self.logEnd or self.chunkEnd > target: return self.chunk[0:0]
+            rows = self.log.read(start=self.chunkEnd, end=self.chunkEnd + TelemetryReplay.CHUNK_SECONDS)
+            # read is inclusive on both ends, the previous chunk already had chunkEnd
+            self.chunk = rows[rows['time'] > self.chunkEnd]
+            self.chunkEnd += TelemetryReplay.CHUNK_SECONDS
+            self.offset = 0
+
+    def __run(self):
+        while not self.stopEvent.is_set():
+            self.playing.wait()
+            with self.lock:
+                target = np.inf if self.speed <= 0 else self.getPosition()
+                rows = self.__take(target)
+                if len(rows) > 0:
+                    self.position = rows['time'][-1]
+                elif self.offset >= len(self.chunk) and self.chunkEnd >= self.logEnd:
+                    self.finished = True
+                    if self.loop: self.__seek(self.logStart)
+                updates = self.__resolve(rows)
+            if len(updates) > 0:
+                # waiting for delivery keeps flat out replay from flooding the io loop
+                IoLoop.submit(TelemetryReplay.__deliver(updates)).result()
+                self.delivered += len(updates)
+            if self.speed > 0 or len(rows) == 0:
+                self.stopEvent.wait(1/TelemetryReplay.TICK_RATE)
+
+    def __resolve(self, rows):
+        updates = []
+        for channel, value in zip(rows['channel'], rows['value']):
+            key = self.log.getKey(channel)
+            for container in self.keys.get(key, ()):
+                updates.append((container, key, float(value)))
+        return updates
+
+    @staticmethod
+    async def __deliver(updates):
+        # the log keeps values as doubles, the original variant type is not recorded
+        for container, key, value in updates:
+            container.setValue(key, value, ua.VariantType.Double)
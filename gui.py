@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 import nest_asyncio
 import colorama
+import argparse
+import time
 
 from asset import *
+from connections.opcua import Opcua
+from connections.telemetryProcess import TelemetryProcess
+from connections.telemetryRecorder import TelemetryRecorder
+from connections.telemetryReplay import TelemetryReplay
 from scenes.digitalTwinLab import *
 from scenes.loadedScene import *
 from utils.debug import *
@@ -13,7 +19,26 @@ nest_asyncio.apply()
 
 @funcProfiler(ftype='init')
 def run():
-    window = Window((1200, 800), 'Digital Twin GUI', fullscreen=False, resizeable=True, vsync=True)
+    parser = argparse.ArgumentParser(description='Digital Twin GUI')
+    parser.add_argument('--record', nargs='?', const=f'logs/telemetry/{time.strftime("%Y%m%d-%H%M%S")}', default=None,
+        help='record all opcua data changes to a telemetry log directory')
+    parser.add_argument('--replay', default=None, help='drive the scene from a recorded telemetry log instead of the server')
+    parser.add_argument('--replay-speed', type=float, default=1, help='replay speed multiplier, 0 replays as fast as possible')
+    parser.add_argument('--replay-loop', action='store_true')
+    parser.add_argument('--telemetry-process', action='store_true', help='run opcua subscriptions in a separate process')
+    parser.add_argument('--backfill', action='store_true', help='read server history for telemetry missed while disconnected')
+    parser.add_argument('--no-vsync', action='store_true', help='render unthrottled, for frame time benchmarks')
+    args = parser.parse_args()
+    Opcua.HISTORY_BACKFILL = args.backfill
+    if args.replay != None:
+        TelemetryReplay.start(args.replay, speed=args.replay_speed, loop=args.replay_loop)
+    elif args.telemetry_process:
+        # the telemetry process receives the data changes and records them
+        TelemetryProcess.start(recordPath=args.record)
+    if args.record != None and TelemetryProcess.INSTANCE == None:
+        TelemetryRecorder.start(args.record)
+
+    window = Window((1200, 800), 'Digital Twin GUI', fullscreen=False, resizeable=True, vsync=not args.no_vsync)
 
     labScene = DigitalTwinLab(window, 'Digital Twin Lab')
     labScene.createUi()
@@ -23,6 +48,9 @@ def run():
     windowSceneManager.createUi()
 
     window.run()
+    TelemetryReplay.stop()
+    TelemetryProcess.stop()
+    TelemetryRecorder.stop()
 
 if __name__ == "__main__":
     run()
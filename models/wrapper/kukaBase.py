@@ -1,8 +1,11 @@
 from asset import *
 
 from connections.opcua import *
+from connections.opcuaMonitorParams import MonitorParams
 from connections.opcuaReceiver import OpcuaReceiver
+from connections.opcuaSubscriptionClass import SubscriptionClass
 from connections.opcuaTransmitter import OpcuaTransmitter
+from connections.telemetryLatency import TelemetryLatency
 from constants import Constants
 
 from models.interfaces.model import Updatable, Serializable
@@ -16,7 +19,12 @@ from window import Window
 
 class KukaBase(Updatable, PollController, Serializable):
 
-    def __init__(self, modelRenderer, model, opcuaName, posParams=(0,0,0,True)):
+    # bases move slowly compared to the arms
+    BASE_MONITORING = MonitorParams(samplingInterval=200, deadband=0.001)
+    BASE_LATENCY = TelemetryLatency.get('base')
+
+    def __init__(self, modelRenderer, model, opcuaName, posParams=(0,0,0,True), hasChannels=True):
+        # without channels the base is a fixed bench that stays at posParams
         self.modelRenderer = modelRenderer
         self.model = model
         self.nodeId, self.robotId = opcuaName
@@ -27,41 +35,48 @@ class KukaBase(Updatable, PollController, Serializable):
         self.attachT = np.identity(4)
 
         self.isLinkedOpcua = True
+        self.hasMoved = True
         self.inView = True
         self.viewCheckFrame = -1
 
         self.modelId = self.modelRenderer.addModel(self.model, self.transform)
 
-        self.__setupConnections()
+        self.__setupConnections(hasChannels)
     
-    def __setupConnections(self):
+    def __setupConnections(self, hasChannels):
         self.opcuaReceiverContainer = OpcuaContainer()
         self.receivers = []
-        self.receivers.append(OpcuaReceiver([ 
-                    self.__getNodeName('d_BaseX'),
-                    self.__getNodeName('d_BaseY'),
-                    self.__getNodeName('d_BaseA'),
-                ], self.opcuaReceiverContainer, Constants.OPCUA_LOCATION))
+        self.baseSeq = 0
+        if not hasChannels: return
+        data = [
+            self.__getNodeName('d_BaseX'),
+            self.__getNodeName('d_BaseY'),
+            self.__getNodeName('d_BaseA'),
+        ]
+        self.receivers.append(OpcuaReceiver(data, self.opcuaReceiverContainer, Constants.OPCUA_LOCATION, 
+                    monitoring=MonitorParams.forKeys(data, KukaBase.BASE_MONITORING),
+                    classes=SubscriptionClass.forKeys(data, SubscriptionClass.STATUS)))
+        self.opcuaReceiverContainer.addGroup('base', self.receivers[0].data)
+        self.opcuaReceiverContainer.addListener(self.receivers[0].data, self.__updateFromOpcua)
         
     def __getNodeName(self, varName):
         return f'ns={self.nodeId};s=R{self.robotId}{varName}'
     
     @funcProfiler(ftype='kukaupdate')
     def update(self, delta):
-        self.__updateFromOpcua()
+        # telemetry is pushed through __updateFromOpcua, an idle base does no work here
+        if not self.hasMoved: return
+        self.hasMoved = False
         self.transform = createTransformationMatrix(self.liveBaseX, self.liveBaseY, 0, 0, 0, self.liveBaseA)
         self.attachT = np.matmul(self.transform, self.attachRel)
-        if not self.inView: return
         self.__updatePos()
 
     def __updateFromOpcua(self):
         if not self.isLinkedOpcua: return
-        if not self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_BaseX')): return
-        if not self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_BaseY')): return
-        if not self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_BaseA')): return
-        self.liveBaseX = self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_BaseX'), default=0)[0]
-        self.liveBaseY = self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_BaseY'), default=0)[0]
-        self.liveBaseA = self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_BaseA'), default=0)[0]
+        if not self.opcuaReceiverContainer.hasGroupUpdated('base', self.baseSeq): return
+        self.baseSeq, (self.liveBaseX, self.liveBaseY, self.liveBaseA) = self.opcuaReceiverContainer.getGroup('base')
+        self.hasMoved = True
+        self.opcuaReceiverContainer.consumeStamps(self.receivers[0].data, KukaBase.BASE_LATENCY)
         if self.inLocalFrame: return
         self.liveBaseX, self.liveBaseY, self.liveBaseA = FleetToLocalTransform(self.liveBaseX, self.liveBaseY, self.liveBaseA)
         
@@ -1,8 +1,13 @@
 from asset import *
 
 from connections.opcua import *
+from connections.opcuaCommandQueue import OpcuaCommandQueue
+from connections.opcuaMonitorParams import MonitorParams
 from connections.opcuaReceiver import OpcuaReceiver
+from connections.opcuaSlotContainer import OpcuaSlotContainer
+from connections.opcuaSubscriptionClass import SubscriptionClass
 from connections.opcuaTransmitter import OpcuaTransmitter
+from connections.telemetryLatency import TelemetryLatency
 from constants import Constants
 
 from scenes.ui.pages import Pages
@@ -17,18 +22,32 @@ from ui.elements.uiText import UiText
 from ui.constraintManager import *
 from ui.uiHelper import *
 from utils.interfaces.pollController import PollController
+from utils.jointStateBuffer import JointStateBuffer
 from utils.debug import *
 from utils.kukaiiwaIKSolver import ForwardKinematics, InverseKinematics, Configuration
 from utils.mathHelper import rad2Deg, deg2Rad
 from window import Window
 
 import numpy as np
+import time
 from asyncua import ua
 import numpy as np
 from scipy.spatial.transform import Rotation as R
 
 class KukaRobot:
 
+    # force sits on a noise floor well below the 3.5N display threshold
+    FORCE_MONITORING = MonitorParams(deadband=0.5)
+    POSE_MONITORING = MonitorParams(deadband=0.1)
+
+    # render joints slightly delayed and interpolated between received
+    # samples instead of stepping on every update
+    JOINT_INTERPOLATION = True
+
+    JOINT_LATENCY = TelemetryLatency.get('joints')
+    FORCE_LATENCY = TelemetryLatency.get('force')
+    POSE_LATENCY = TelemetryLatency.get('pose')
+
     def __init__(self, tmat, nid, rid, modelRenderer, hasGripper=True, hasForceVector=False):
         self.joints = [0,0,0,0,0,0,0]
         self.forceVector = np.array([0,0,0], dtype='float32')
@@ -55,6 +74,11 @@ class KukaRobot:
 
         self.exists = True
 
+        self.dirty = True
+        self.lastAttachFrame = None
+        self.jointBuffer = JointStateBuffer()
+        self.jointsSettled = True
+
         self.__loadModel()
         self.__setupConnections()
     
@@ -80,65 +104,83 @@ class KukaRobot:
             self.lastTmats[id] = None
         self.lastLinkTmats = Robot1_T_0_.copy()
         self.exists = True
+        self.dirty = True
     
     def __getNodeName(self, name):
         return f'ns={self.nodeId};s={self.robotId}{name}'
 
     def __setupConnections(self):
-        self.opcuaReceiverContainer = OpcuaContainer()
+        data = [self.__getNodeName(f'd_{name}') for name in (
+            'Joi1', 'Joi2', 'Joi3', 'Joi4', 'Joi5', 'Joi6', 'Joi7',
+            'ForX', 'ForY', 'ForZ',
+            'PosX', 'PosY', 'PosZ', 'RotA', 'RotB', 'RotC')]
+        self.opcuaReceiverContainer = OpcuaSlotContainer(data)
+        self.jointKeys = data[0:7]
+        self.forceKeys = data[7:10]
+        self.poseKeys = data[10:16]
+        self.jointSlots = self.opcuaReceiverContainer.getSlots(self.jointKeys)
         self.receivers = []
-        self.receivers.append(OpcuaReceiver([ 
-                    self.__getNodeName('d_Joi1'),
-                    self.__getNodeName('d_Joi2'),
-                    self.__getNodeName('d_Joi3'),
-                    self.__getNodeName('d_Joi4'),
-                    self.__getNodeName('d_Joi5'),
-                    self.__getNodeName('d_Joi6'),
-                    self.__getNodeName('d_Joi7'),
-                    self.__getNodeName('d_ForX'),
-                    self.__getNodeName('d_ForY'),
-                    self.__getNodeName('d_ForZ'),
-                    self.__getNodeName('d_PosX'),
-                    self.__getNodeName('d_PosY'),
-                    self.__getNodeName('d_PosZ'),
-                    self.__getNodeName('d_RotA'),
-                    self.__getNodeName('d_RotB'),
-                    self.__getNodeName('d_RotC'),
-                ], self.opcuaReceiverContainer, Constants.OPCUA_LOCATION))
+        monitoring = MonitorParams.forKeys(data[7:10], KukaRobot.FORCE_MONITORING)
+        monitoring.update(MonitorParams.forKeys(data[10:16], KukaRobot.POSE_MONITORING))
+        # joints drive the rendered pose, force and pose only feed the overlays
+        classes = SubscriptionClass.forKeys(self.jointKeys, SubscriptionClass.MOTION)
+        classes.update(SubscriptionClass.forKeys(self.forceKeys + self.poseKeys, SubscriptionClass.STATUS))
+        self.receivers.append(OpcuaReceiver(data, self.opcuaReceiverContainer, Constants.OPCUA_LOCATION, monitoring=monitoring, classes=classes))
+        self.opcuaReceiverContainer.addGroup('force', self.forceKeys)
+        self.opcuaReceiverContainer.addGroup('pose', self.poseKeys)
+        self.opcuaReceiverContainer.addListener(data, self.__updateFromOpcua)
+        self.forceSeq = 0
+        self.poseSeq = 0
     
     @funcProfiler(ftype='kukaupdate')
     def update(self, delta):
-        self.__updateFromOpcua()
+        # telemetry is pushed through __updateFromOpcua, an idle robot on a
+        # static attachment skips the per link transforms entirely
+        if not self.jointsSettled:
+            joints, self.jointsSettled = self.jointBuffer.sample(time.time())
+            self.joints = joints.tolist()
+            self.dirty = True
+        attachFrame = self.attach.getFrame() if self.attach else None
+        if not self.dirty and attachFrame is self.lastAttachFrame: return
+        self.dirty = False
+        self.lastAttachFrame = attachFrame
         self.__updateJoints()
         if self.endPose is not None:
             self.__updateForceVector(self.endPose)
     
     def __updateFromOpcua(self):
         if not self.isLinkedOpcua: return
-        for i in range(7):
-            nodename = self.__getNodeName(f'd_Joi{i+1}')
-            if self.opcuaReceiverContainer.hasUpdated(nodename):
-                self.joints[i] = radians(self.opcuaReceiverContainer.getValue(nodename, default=0)[0])
-
-        if (self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_ForX')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_ForY')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_ForZ'))):
-            self.forceVector[0] = self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_ForX'), default=0)[0]
-            self.forceVector[1] = self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_ForY'), default=0)[0]
-            self.forceVector[2] = self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_ForZ'), default=0)[0]
-        if (self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_PosX')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_PosY')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_PosZ')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_RotA')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_RotB')) and
-            self.opcuaReceiverContainer.hasUpdated(self.__getNodeName(f'd_RotC'))):
-            pos =  (self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_PosX'), default=0)[0]/1000,
-                    self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_PosY'), default=0)[0]/1000,
-                    self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_PosZ'), default=0)[0]/1000)
-            rot =  (self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_RotA'), default=0)[0],
-                    self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_RotB'), default=0)[0],
-                    self.opcuaReceiverContainer.getValue(self.__getNodeName(f'd_RotC'), default=0)[0])
+        self.dirty = True
+        if self.opcuaReceiverContainer.hasUpdatedSlots(self.jointSlots):
+            joints = np.radians(self.opcuaReceiverContainer.getSlotValues(self.jointSlots))
+            delay = 0
+            if KukaRobot.JOINT_INTERPOLATION:
+                self.__bufferJoints(joints)
+                # the buffer draws samples getDelay() after they arrive
+                delay = self.jointBuffer.getDelay()
+            else:
+                self.joints = joints.tolist()
+            self.opcuaReceiverContainer.consumeStamps(self.jointKeys, KukaRobot.JOINT_LATENCY, delay)
+
+        if self.opcuaReceiverContainer.hasGroupUpdated('force', self.forceSeq):
+            self.forceSeq, force = self.opcuaReceiverContainer.getGroup('force')
+            self.forceVector[:] = force
+            self.opcuaReceiverContainer.consumeStamps(self.forceKeys, KukaRobot.FORCE_LATENCY)
+        if self.opcuaReceiverContainer.hasGroupUpdated('pose', self.poseSeq):
+            self.poseSeq, pose = self.opcuaReceiverContainer.getGroup('pose')
+            pos = (pose[0]/1000, pose[1]/1000, pose[2]/1000)
+            rot = pose[3:6]
             self.endPose = createTransformationMatrix(*pos, *rot)
+            self.opcuaReceiverContainer.consumeStamps(self.poseKeys, KukaRobot.POSE_LATENCY)
+
+    def __bufferJoints(self, joints):
+        now = time.time()
+        stamp = self.opcuaReceiverContainer.getLatestStamp(self.jointKeys)
+        # replayed values carry no stamps, nor do values from servers without source timestamps
+        if stamp == None or np.isnan(stamp[0]):
+            stamp = (now, now)
+        self.jointBuffer.push(stamp[0], stamp[1], joints)
+        self.jointsSettled = False
     
     def __updateJoints(self):
         if not self.exists: return
@@ -242,14 +284,21 @@ class KukaRobot:
 
     def disconnectOpcua(self):
         self.isLinkedOpcua = False
+        self.dirty = True
+        self.jointBuffer.clear()
+        self.jointsSettled = True
         self.stop()
 
     def connectOpcua(self):
         self.isLinkedOpcua = True
+        self.dirty = True
         self.start()
 
     def setJoints(self, angles):
-        self.joints = angles
+        if np.array_equal(angles, self.joints): return
+        # keep a copy, callers go on changing their list in place
+        self.joints = list(angles)
+        self.dirty = True
 
     def getJoints(self):
         return self.joints
@@ -362,13 +411,17 @@ class KukaRobotTwin(Updatable, Interactable, PollController, Serializable):
 
     def __setupConnections(self):
         self.opcuaReceiverContainer = OpcuaContainer()
-        self.opcuaTransmitterContainer = OpcuaContainer()
-        self.progControlReceiver = OpcuaReceiver([
+        self.opcuaTransmitterContainer = OpcuaCommandQueue(self.robotId)
+        progControl = [
                     self.__getNodeName('c_ProgID'),
                     self.__getNodeName('c_Start'),
                     self.__getNodeName('f_Ready'),
                     self.__getNodeName('f_End'),
-                ], self.opcuaReceiverContainer, Constants.OPCUA_LOCATION, pollingRate=5)
+                ]
+        self.progControlReceiver = OpcuaReceiver(progControl, self.opcuaReceiverContainer, Constants.OPCUA_LOCATION, pollingRate=5,
+                    classes=SubscriptionClass.forKeys(progControl, SubscriptionClass.CONTROL))
+        self.opcuaReceiverContainer.addListener(self.progControlReceiver.data, self.__onProgramUpdate)
+        self.programDirty = True
         self.transmitter = OpcuaTransmitter(self.opcuaTransmitterContainer, Constants.OPCUA_LOCATION, pollingRate=5)
 
     def __createUi(self):
@@ -569,7 +622,14 @@ class KukaRobotTwin(Updatable, Interactable, PollController, Serializable):
         self.__updateJoints()
         self.hasMoved = False
     
+    def __onProgramUpdate(self):
+        self.programDirty = True
+
     def __updateProgram(self):
+        # only re-evaluated while a program is in flight or after the
+        # program control channels have pushed a change
+        if not (self.programDirty or self.progStartFlag or self.executingFlag or self.doneFlag): return
+        self.programDirty = False
         if not self.opcuaReceiverContainer.getValue(self.__getNodeName('f_Ready'), default=False)[0]:
             self.sendBtn.lock()
         if self.progStartFlag:
@@ -579,7 +639,7 @@ class KukaRobotTwin(Updatable, Interactable, PollController, Serializable):
             if self.__isTransmitClear():
                 self.executingFlag = True
                 self.progStartFlag = False
-                self.opcuaTransmitterContainer.setValue(self.__getNodeName('c_Start'), True, ua.VariantType.Boolean)
+                self.opcuaTransmitterContainer.setValue(self.__getNodeName('c_Start'), True, ua.VariantType.Boolean, urgent=True)
         elif self.executingFlag:
             self.sendBtn.lock()
             self.unlinkBtn.lock()
@@ -595,6 +655,7 @@ class KukaRobotTwin(Updatable, Interactable, PollController, Serializable):
             self.unlinkBtnText.setText('Unlink')
             self.sendBtnText.setText('Execute')
             self.__toggleTwin()
+            self.programDirty = True
         elif self.opcuaReceiverContainer.getValue(self.__getNodeName('f_Ready'), default=False)[0]:
             self.sendBtn.unlock()
     
@@ -720,7 +781,7 @@ class KukaRobotTwin(Updatable, Interactable, PollController, Serializable):
                 self.sendBtn.lock()
                 for i in range(len(self.twinJoints)):
                     self.opcuaTransmitterContainer.setValue(self.__getNodeName(f'c_Joi{i+1}'), self.twinJoints[i]*180/pi, ua.VariantType.Double)
-                self.opcuaTransmitterContainer.setValue(self.__getNodeName(f'c_ProgID'), KukaRobotTwin.FREE_MOVE_PROG, ua.VariantType.Int32)
+                self.opcuaTransmitterContainer.setValue(self.__getNodeName(f'c_ProgID'), KukaRobotTwin.FREE_MOVE_PROG, ua.VariantType.Int32, urgent=True)
                 self.progStartFlag = True
             if event['obj'] == self.unlinkBtn:
                 self.__toggleLink()
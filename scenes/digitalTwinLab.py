@@ -1,6 +1,9 @@
 from asset import *
 
 from connections.mjpegStream import MJPEGStream
+from connections.opcuaDiscovery import RobotCatalogue
+from connections.telemetryReplay import TelemetryReplay
+from constants import Constants
 
 from scenes.scene import Scene
 from scenes.utils.movingCamera import MovingCamera
@@ -38,6 +41,23 @@ class DigitalTwinLab(Scene):
 
     UI_PADDING = 10
 
+    # placement and looks of the lab's robots, by robot id:
+    # (base asset, base posParams, attach height, arm transform, gripper, live color, twin color)
+    ROBOT_LAYOUTS = {
+        # ROBOT 3 - KEENANS DEMO ROBOT
+        'R3': ('KUKA_FLEX', (4,4,0,True), 0.89, (0.315, 0, 0, 0, 0, 0), True, (1, 51/255, 51/255, 0.7), (1, 178/255, 102/255, 0.0)),
+        # ROBOT 4 - MSM Testing ROBOT
+        'R4': ('KUKA_FLEX', (0,0,0,True), 0.89, (0.315, 0, 0, 0, 0, 0), False, (1, 1, 0, 0.7), (1, 1, 153/255, 0.0)),
+        # ROBOT 1 - Moblie 1
+        'R1': ('OMNIMOVE', (0,0,0,False), 0.7, (0.363, -0.184, 0, 0, 0, -90), True, (0, 1, 0, 0.7), (102/255, 1, 178/255, 0.0)),
+        # ROBOT 2 - Moblie 2
+        'R2': ('OMNIMOVE', (0,0,0,False), 0.7, (0.363, -0.184, 0, 0, 0, -90), True, (0, 0.5, 1.0, 0.7), (153/255, 153/255, 1, 0.0)),
+    }
+    # discovered robots without a layout are lined up along the room
+    DEFAULT_LAYOUT = ('KUKA_FLEX', None, 0.89, (0.315, 0, 0, 0, 0, 0), True, (0.7, 0.7, 0.7, 0.7), (0.85, 0.85, 0.85, 0.0))
+    # (namespace, robot id) used when the server is unreachable and nothing is cached
+    DEFAULT_ROBOTS = [(23, 'R3'), (24, 'R4'), (21, 'R1'), (22, 'R2')]
+
     def __init__(self, window, name):
         super().__init__(window, name)
         self.models = []
@@ -154,48 +174,41 @@ class DigitalTwinLab(Scene):
     @timing
     def __addRobots(self):
         self.bases = []
-        # # ROBOT 3 - KEENANS DEMO ROBOT
-        base = KukaBase(self.modelRenderer, Assets.KUKA_FLEX, (23, 3), posParams=(4,4,0,True))
-        base.setAttachTransform(createTransformationMatrix(0, 0, 0.89, 0, 0, 0))
-        arm = KukaRobotTwin(self.window, createTransformationMatrix(0.315, 0, 0, 0, 0, 0), 23, 'R3', self.modelRenderer, hasForceVector=True, hasGripper=True)
-        arm.setLiveColors([(1, 51/255, 51/255, 0.7)for i in range(9)])
-        arm.setTwinColors([(1, 178/255, 102/255, 0.0)for i in range(9)])
-        arm.setAttach(base)
-        self.bases.append(base)
-        self.models.append(base)
-        self.models.append(arm)
-        
-        # # ROBOT 4 - MSM Testing ROBOT
-        base = KukaBase(self.modelRenderer, Assets.KUKA_FLEX, (24, 4), posParams=(0,0,0,True))
-        base.setAttachTransform(createTransformationMatrix(0, 0, 0.89, 0, 0, 0))
-        arm = KukaRobotTwin(self.window, createTransformationMatrix(0.315, 0, 0, 0, 0, 0), 24, 'R4', self.modelRenderer, hasForceVector=True, hasGripper=False)
-        arm.setLiveColors([(1, 1, 0, 0.7)for i in range(9)])
-        arm.setTwinColors([(1, 1, 153/255, 0.0)for i in range(9)])
-        arm.setAttach(base)
-        self.bases.append(base)
-        self.models.append(base)
-        self.models.append(arm)
-
-        # # ROBOT 1 - Moblie 1
-        base = KukaBase(self.modelRenderer, Assets.OMNIMOVE, (21, 1), posParams=(0,0,0,False))
-        base.setAttachTransform(createTransformationMatrix(0, 0, 0.7, 0, 0, 0))
-        arm = KukaRobotTwin(self.window, createTransformationMatrix(0.363, -0.184, 0, 0, 0, -90), 21, 'R1', self.modelRenderer, hasForceVector=True, hasGripper=True)
-        arm.setLiveColors([(0, 1, 0, 0.7)for i in range(9)])
-        arm.setTwinColors([(102/255, 1, 178/255, 0.0)for i in range(9)])
-        arm.setAttach(base)
-        self.bases.append(base)
-        self.models.append(base)
-        self.models.append(arm)
-        
-        # # ROBOT 2 - Moblie 2
-        base = KukaBase(self.modelRenderer, Assets.OMNIMOVE, (22, 2), posParams=(0,0,0,False))
-        base.setAttachTransform(createTransformationMatrix(0, 0, 0.7, 0, 0, 0))
-        arm = KukaRobotTwin(self.window, createTransformationMatrix(0.363, -0.184, 0, 0, 0, -90), 22, 'R2', self.modelRenderer, hasForceVector=True, hasGripper=True)
-        arm.setLiveColors([(0, 0.5, 1.0, 0.7)for i in range(9)])
-        arm.setTwinColors([(153/255, 153/255, 1, 0.0)for i in range(9)])
-        arm.setAttach(base)
-        self.bases.append(base)
-        self.models.append(base)
+        if TelemetryReplay.INSTANCE != None:
+            catalogue = RobotCatalogue.loadCached(Constants.OPCUA_LOCATION)
+        else:
+            catalogue = RobotCatalogue.load(Constants.OPCUA_LOCATION, hold=True)
+        if catalogue == None:
+            robots = [(ns, rid, True, True, True) for ns, rid in DigitalTwinLab.DEFAULT_ROBOTS]
+        else:
+            robots = [(r.ns, r.rid, r.hasBase(), r.hasArm(), r.hasForce()) for r in catalogue.getRobots()]
+        # known robots first in layout order, then anything new the server has
+        order = list(DigitalTwinLab.ROBOT_LAYOUTS)
+        robots.sort(key=lambda r: (order.index(r[1]) if r[1] in order else len(order), int(r[1][1:])))
+        unknown = 0
+        for ns, rid, hasBase, hasArm, hasForce in robots:
+            layout = DigitalTwinLab.ROBOT_LAYOUTS.get(rid, None)
+            if layout == None:
+                layout = DigitalTwinLab.DEFAULT_LAYOUT
+                layout = (layout[0], (2+unknown, 1, 0, True), *layout[2:])
+                unknown += 1
+            self.__addRobot(ns, rid, hasBase, hasArm, hasForce, layout)
+
+    def __addRobot(self, ns, rid, hasBase, hasArm, hasForce, layout):
+        baseModel, posParams, attachHeight, armTransform, hasGripper, liveColor, twinColor = layout
+        base = None
+        # robots with a layout always stand on their base, only its receiver
+        # depends on the server exposing base channels
+        if hasBase or rid in DigitalTwinLab.ROBOT_LAYOUTS:
+            base = KukaBase(self.modelRenderer, getattr(Assets, baseModel), (ns, int(rid[1:])), posParams=posParams, hasChannels=hasBase)
+            base.setAttachTransform(createTransformationMatrix(0, 0, attachHeight, 0, 0, 0))
+            self.bases.append(base)
+            self.models.append(base)
+        if not hasArm: return
+        arm = KukaRobotTwin(self.window, createTransformationMatrix(*armTransform), ns, rid, self.modelRenderer, hasForceVector=hasForce, hasGripper=hasGripper)
+        arm.setLiveColors([liveColor for i in range(9)])
+        arm.setTwinColors([twinColor for i in range(9)])
+        if base != None: arm.setAttach(base)
         self.models.append(arm)
 
     @timing
@@ -340,6 +353,8 @@ class DigitalTwinLab(Scene):
     def start(self):
         self.modelRenderer.setViewMatrix(createViewMatrix(*self.camera.getCameraTransform()))
         [model.start() for model in self.models if isinstance(model, PollController)]
+        # the receivers now hold the session discovery connected
+        RobotCatalogue.releaseHold(Constants.OPCUA_LOCATION)
         return
 
     @timing
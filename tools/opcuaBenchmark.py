@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Spins up tools.opcuaRobotSim with a growing number of robots and measures
+# source timestamp to render latency and dropped updates through the same
+# receiver, container and dispatcher path the gui uses.
+#   python -m tools.opcuaBenchmark --counts 1 10 50 100 --duration 10
+from connections.ioLoop import IoLoop
+from connections.opcua import OpcuaSessionPool
+from connections.opcuaReceiver import OpcuaReceiver
+from connections.opcuaSlotContainer import OpcuaSlotContainer
+from connections.telemetryDispatcher import TelemetryDispatcher
+from connections.telemetryRecorder import toEpoch
+from tools.opcuaRobotSim import RobotSim
+
+from collections import deque
+
+import numpy as np
+import subprocess
+import argparse
+import time
+import sys
+
+class ProbeContainer(OpcuaSlotContainer):
+
+    def __init__(self, keys, tickKey):
+        super().__init__(keys)
+        self.tickKey = tickKey
+        self.pending = deque()
+
+    def datachange_notification(self, node, value, data):
+        key = self.nodeMapping[node][0]
+        stamp = data.monitored_item.Value.SourceTimestamp
+        self.pending.append((key, value, toEpoch(stamp) if stamp else None))
+        super().datachange_notification(node, value, data)
+
+class RobotProbe:
+
+    def __init__(self, host, ns, rid, pollingRate):
+        keys = [f'ns={ns};s=R{rid}{name}' for name in RobotSim.TELEMETRY + [RobotSim.TICK]]
+        self.container = ProbeContainer(keys, keys[-1])
+        self.receiver = OpcuaReceiver(keys, self.container, host, pollingRate=pollingRate)
+        self.container.addListener(keys, self.consume)
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.notifications = 0
+        self.lastTick = None
+        self.ticks = 0
+        self.dropped = 0
+
+    def consume(self):
+        # runs on the "render" thread through TelemetryDispatcher.drain
+        now = time.time()
+        pending = self.container.pending
+        for _ in range(len(pending)):
+            key, value, stamp = pending.popleft()
+            self.notifications += 1
+            if stamp != None: self.latencies.append(now - stamp)
+            if key != self.container.tickKey: continue
+            if self.lastTick != None and value > self.lastTick + 1:
+                self.dropped += value - self.lastTick - 1
+            self.lastTick = value
+            self.ticks += 1
+
+def waitForServer(host, timeout=60):
+    session = IoLoop.submit(OpcuaSessionPool.acquire(host)).result(5)
+    try:
+        end = time.time() + timeout
+        while time.time() < end:
+            if session.connected.is_set(): return True
+            time.sleep(0.2)
+        return False
+    finally:
+        IoLoop.submit(OpcuaSessionPool.release(host)).result(5)
+
+def runCase(count, args):
+    host = f'opc.tcp://127.0.0.1:{args.port}/server/'
+    server = subprocess.Popen([sys.executable, '-m', 'tools.opcuaRobotSim',
+        '--robots', str(count), '--rate', str(args.rate), '--profile', args.profile,
+        '--port', str(args.port), '--ns-base', str(args.ns_base)])
+    try:
+        if not waitForServer(host):
+            print(f'simulator with {count} robots did not come up')
+            return None
+        probes = [RobotProbe(host, args.ns_base+i, i+1, args.polling_rate) for i in range(count)]
+        for probe in probes: probe.receiver.start()
+
+        frameTime = 1/args.fps
+        measureStart = time.time() + args.warmup
+        end = measureStart + args.duration
+        measuring = False
+        frameTimes = []
+        while time.time() < end:
+            frameStart = time.time()
+            if not measuring and frameStart >= measureStart:
+                measuring = True
+                for probe in probes: probe.reset()
+            TelemetryDispatcher.drain()
+            spent = time.time() - frameStart
+            if measuring: frameTimes.append(spent)
+            time.sleep(max(0, frameTime - spent))
+
+        for probe in probes: probe.receiver.stop()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+    latencies = np.array([l for p in probes for l in p.latencies])*1000
+    ticks = sum(p.ticks for p in probes)
+    dropped = sum(p.dropped for p in probes)
+    return {
+        'robots': count,
+        'rate': sum(p.notifications for p in probes)/args.duration,
+        'p50': np.percentile(latencies, 50) if len(latencies) else float('nan'),
+        'p95': np.percentile(latencies, 95) if len(latencies) else float('nan'),
+        'p99': np.percentile(latencies, 99) if len(latencies) else float('nan'),
+        'dropped': 100*dropped/max(1, ticks+dropped),
+        'drain': 1000*np.mean(frameTimes) if len(frameTimes) else float('nan'),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='OPC UA telemetry latency benchmark')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1, 2, 5, 10, 20, 50, 100])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--rate', type=float, default=30, help='simulator updates per second per robot')
+    parser.add_argument('--polling-rate', type=float, default=30, help='receiver publishing rate')
+    parser.add_argument('--profile', choices=RobotSim.PROFILES, default='sine')
+    parser.add_argument('--fps', type=float, default=60)
+    parser.add_argument('--port', type=int, default=4841)
+    parser.add_argument('--ns-base', type=int, default=21)
+    args = parser.parse_args()
+
+    print(f'{"robots":>6} {"notif/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"dropped":>8} {"drain ms":>9}')
+    for count in args.counts:
+        r = runCase(count, args)
+        if r == None: continue
+        print(f'{r["robots"]:>6} {r["rate"]:>9.0f} {r["p50"]:>8.1f} {r["p95"]:>8.1f} {r["p99"]:>8.1f} {r["dropped"]:>7.2f}% {r["drain"]:>9.3f}', flush=True)
+    IoLoop.shutdown()
+
+if __name__ == '__main__':
+    main()
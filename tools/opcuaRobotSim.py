@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Stand-in OPC UA server publishing the node layout KukaRobot, KukaRobotTwin
+# and KukaBase expect, for running the GUI and benchmarks without the lab PLC.
+#   python -m tools.opcuaRobotSim --robots 4 --rate 30 --profile sine
+from asyncua import Server, ua
+from datetime import datetime, timezone
+
+import argparse
+import asyncio
+import random
+import time
+import math
+
+class RobotSim:
+
+    TELEMETRY = [
+        'd_Joi1', 'd_Joi2', 'd_Joi3', 'd_Joi4', 'd_Joi5', 'd_Joi6', 'd_Joi7',
+        'd_ForX', 'd_ForY', 'd_ForZ',
+        'd_PosX', 'd_PosY', 'd_PosZ', 'd_RotA', 'd_RotB', 'd_RotC',
+        'd_BaseX', 'd_BaseY', 'd_BaseA',
+    ]
+    COMMANDS = [
+        ('c_Joi1', 0.0, ua.VariantType.Double),
+        ('c_Joi2', 0.0, ua.VariantType.Double),
+        ('c_Joi3', 0.0, ua.VariantType.Double),
+        ('c_Joi4', 0.0, ua.VariantType.Double),
+        ('c_Joi5', 0.0, ua.VariantType.Double),
+        ('c_Joi6', 0.0, ua.VariantType.Double),
+        ('c_Joi7', 0.0, ua.VariantType.Double),
+        ('c_ProgID', 0, ua.VariantType.Int32),
+        ('c_Start', False, ua.VariantType.Boolean),
+        ('f_Ready', True, ua.VariantType.Boolean),
+        ('f_End', False, ua.VariantType.Boolean),
+    ]
+    # not read by the gui, incremented once per tick so clients can count dropped updates
+    TICK = 's_Tick'
+
+    JOINT_LIMITS = [170, 120, 170, 120, 170, 120, 175]
+    PROFILES = ['sine', 'step', 'idle']
+    COMMAND_DURATION = 2
+
+    def __init__(self, server, ns, rid, rate, profile):
+        self.server = server
+        self.ns = ns
+        self.rid = rid
+        self.rate = rate
+        self.profile = profile
+        self.nodes = {}
+        self.tick = 0
+        self.t0 = time.time()
+        self.phase = random.random()*2*math.pi
+
+        self.joints = [0.0]*7
+        self.stepFrom = [0.0]*7
+        self.stepTo = [0.0]*7
+        self.stepStart = 0
+        self.command = None
+
+    def nodeName(self, name):
+        return f'R{self.rid}{name}'
+
+    async def create(self):
+        folder = await self.server.nodes.objects.add_folder(ua.NodeId(f'R{self.rid}', self.ns), f'R{self.rid}')
+        for name in RobotSim.TELEMETRY:
+            await self.__addVariable(folder, name, 0.0, ua.VariantType.Double)
+        for name, value, vtype in RobotSim.COMMANDS:
+            await self.__addVariable(folder, name, value, vtype)
+        await self.__addVariable(folder, RobotSim.TICK, 0, ua.VariantType.UInt32)
+
+    async def __addVariable(self, folder, name, value, vtype):
+        node = await folder.add_variable(ua.NodeId(self.nodeName(name), self.ns), self.nodeName(name), ua.Variant(value, vtype))
+        await node.set_writable()
+        self.nodes[name] = node.nodeid
+
+    async def run(self):
+        period = 1/self.rate
+        nextTick = time.perf_counter()
+        while True:
+            await self.__checkCommand()
+            await self.__publish(time.time() - self.t0)
+            nextTick += period
+            delay = nextTick - time.perf_counter()
+            if delay < 0:
+                # fell behind, skip the missed ticks instead of bursting
+                nextTick = time.perf_counter()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def __checkCommand(self):
+        if self.command != None:
+            if time.time() - self.command < RobotSim.COMMAND_DURATION: return
+            self.command = None
+            await self.__write('c_ProgID', 0, ua.VariantType.Int32)
+            await self.__write('c_Start', False, ua.VariantType.Boolean)
+            return
+        start = self.server.read_attribute_value(self.nodes['c_Start'])
+        if not start.Value.Value: return
+        self.stepFrom = self.joints.copy()
+        self.stepTo = []
+        for i in range(7):
+            target = self.server.read_attribute_value(self.nodes[f'c_Joi{i+1}'])
+            self.stepTo.append(target.Value.Value)
+        self.command = time.time()
+
+    def __motion(self, t):
+        if self.command != None:
+            k = min(1, (time.time() - self.command)/RobotSim.COMMAND_DURATION)
+            return [a + (b-a)*k for a, b in zip(self.stepFrom, self.stepTo)]
+        if self.profile == 'sine':
+            return [0.5*limit*math.sin(0.2*(i+1)*t + self.phase) for i, limit in enumerate(RobotSim.JOINT_LIMITS)]
+        if self.profile == 'step':
+            if t - self.stepStart >= 3:
+                self.stepStart = t
+                self.stepFrom = self.joints.copy()
+                self.stepTo = [random.uniform(-0.5, 0.5)*limit for limit in RobotSim.JOINT_LIMITS]
+            k = min(1, (t - self.stepStart)/1.5)
+            return [a + (b-a)*k for a, b in zip(self.stepFrom, self.stepTo)]
+        return self.joints
+
+    async def __publish(self, t):
+        self.joints = self.__motion(t)
+        self.tick += 1
+        # force sits on a noise floor, pose and base follow the joints loosely
+        values = list(self.joints)
+        values += [random.gauss(0, 0.5) for _ in range(3)]
+        values += [400 + 200*math.sin(math.radians(self.joints[0])), 200*math.cos(math.radians(self.joints[1])), 600 + 100*math.sin(math.radians(self.joints[3]))]
+        # rotations in degrees like the real robot, KukaRobot feeds them to createTransformationMatrix
+        values += [self.joints[4], self.joints[5]/2, self.joints[6]]
+        values += [0.5*math.sin(0.05*t + self.phase), 0.5*math.cos(0.05*t + self.phase), math.degrees(0.05*t) % 360]
+        stamp = datetime.now(timezone.utc)
+        for name, value in zip(RobotSim.TELEMETRY, values):
+            await self.__write(name, value, ua.VariantType.Double, stamp)
+        await self.__write(RobotSim.TICK, self.tick, ua.VariantType.UInt32, stamp)
+
+    async def __write(self, name, value, vtype, stamp=None):
+        stamp = stamp or datetime.now(timezone.utc)
+        dv = ua.DataValue(ua.Variant(value, vtype), SourceTimestamp=stamp, ServerTimestamp=stamp)
+        await self.server.write_attribute_value(self.nodes[name], dv)
+
+async def runServer(robots, rate, profile, port=4840, nsBase=21):
+    server = Server()
+    await server.init()
+    server.set_endpoint(f'opc.tcp://0.0.0.0:{port}/server/')
+    server.set_server_name('OpcuaGUI robot simulator')
+
+    # robot n lives in namespace nsBase+n-1, matching the lab's ns=21..24 for R1..R4
+    sims = []
+    for i in range(robots):
+        ns = nsBase + i
+        namespaces = await server.get_namespace_array()
+        while len(namespaces) <= ns:
+            await server.register_namespace(f'urn:opcuagui:sim:ns{len(namespaces)}')
+            namespaces = await server.get_namespace_array()
+        sims.append(RobotSim(server, ns, i+1, rate, profile))
+    for sim in sims:
+        await sim.create()
+
+    async with server:
+        print(f'Robot simulator running: {robots} robots at {rate}Hz on opc.tcp://127.0.0.1:{port}/server/', flush=True)
+        await asyncio.gather(*[sim.run() for sim in sims])
+
+def main():
+    parser = argparse.ArgumentParser(description='OPC UA stand-in for the lab robots')
+    parser.add_argument('--robots', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=30, help='telemetry updates per second per robot')
+    parser.add_argument('--profile', choices=RobotSim.PROFILES, default='sine')
+    parser.add_argument('--port', type=int, default=4840)
+    parser.add_argument('--ns-base', type=int, default=21)
+    args = parser.parse_args()
+    try:
+        asyncio.run(runServer(args.robots, args.rate, args.profile, args.port, args.ns_base))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -16,6 +16,7 @@ PROFILER_LAYER = 0
 PROFILER_TOTAL = [0]
 PROFILER_LAYER_COUNT = [0]
 PROFILER_ACCUM = {}
+PROFILER_REPORTS = []
 
 def timing(func):
     def wrapper(*arg, **kw):
@@ -80,6 +81,10 @@ def funclog(string):
     tab = f'{Fore.CYAN}{"".join(TIMING_TREE)}{"├" if TIMING_LAYER_COUNT[-1] > 1 else "┌"}{Style.RESET_ALL}'
     print(f"{tab}{string}{Style.RESET_ALL}")
 
+def addProfileReport(func):
+    # extra sections printed after the profile report
+    PROFILER_REPORTS.append(func)
+
 def profileReport():
     global PROFILER_ACCUM
     total = sum(PROFILER_ACCUM.values())
@@ -88,4 +93,5 @@ def profileReport():
     print(f'Profile Report:')
     for k, v in kv:
         print(f'  {k}: {' '*(lkey-len(k))}{Fore.BLUE}{round(v/total*100, 2)}%{Style.RESET_ALL}')
-
+    for report in PROFILER_REPORTS:
+        report()
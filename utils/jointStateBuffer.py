@@ -0,0 +1,63 @@
+import numpy as np
+
+class JointStateBuffer:
+
+    # Timestamped joint samples for one robot, sampled a little in the past
+    # so there is almost always a newer sample to interpolate towards.
+    # Sample times are source timestamps, they are mapped to the local clock
+    # with the smallest receive - source offset seen, which absorbs both
+    # clock skew and the fastest transport latency.
+    def __init__(self, joints=7, size=32, delay=0.05, maxExtrapolation=0.1):
+        self.size = size
+        self.delay = delay
+        self.maxExtrapolation = maxExtrapolation
+        self.times = np.zeros(size)
+        self.values = np.zeros((size, joints))
+        self.offsets = np.zeros(size)
+        self.count = 0
+        self.head = 0
+
+    def clear(self):
+        self.count = 0
+        self.head = 0
+
+    def push(self, source, received, joints):
+        if self.count > 0 and source <= self.times[(self.head-1) % self.size]: return
+        self.times[self.head] = source
+        self.values[self.head] = joints
+        self.offsets[self.head] = received - source
+        self.head = (self.head+1) % self.size
+        self.count = min(self.count+1, self.size)
+
+    def getDelay(self):
+        # at least one and a half sample periods, so lowering the
+        # subscription rate does not turn every frame into an extrapolation
+        if self.count < 3: return self.delay
+        times = self.__ordered(self.times)
+        return max(self.delay, 1.5*float(np.median(np.diff(times))))
+
+    def sample(self, now):
+        # returns (joints, settled), settled once the rendered pose is
+        # back on the newest sample after any extrapolation
+        if self.count == 0: return (None, True)
+        times = self.__ordered(self.times)
+        values = self.__ordered(self.values)
+        t = now - self.offsets[:self.count].min() - self.getDelay()
+        if t <= times[0]: return (values[0], self.count == 1)
+        if t >= times[-1]:
+            if self.count == 1: return (values[-1], True)
+            velocity = (values[-1] - values[-2])/(times[-1] - times[-2])
+            over = t - times[-1]
+            if over <= self.maxExtrapolation: return (values[-1] + velocity*over, False)
+            # no newer sample came, the robot stopped, ease back onto the
+            # last sample over another maxExtrapolation and settle there
+            back = (over - self.maxExtrapolation)/self.maxExtrapolation
+            if back >= 1: return (values[-1], True)
+            return (values[-1] + velocity*self.maxExtrapolation*(1 - back), False)
+        i = int(np.searchsorted(times, t, 'right'))
+        k = (t - times[i-1])/(times[i] - times[i-1])
+        return (values[i-1] + (values[i] - values[i-1])*k, False)
+
+    def __ordered(self, array):
+        if self.count < self.size: return array[:self.count]
+        return np.roll(array, -self.head, axis=0)
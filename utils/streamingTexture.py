@@ -0,0 +1,127 @@
+import OpenGL.GL as GL
+import ctypes
+
+class StreamingTexture:
+
+    # Texture for frames that change every few render frames. Storage is
+    # allocated once per frame size, frames go through a ring of pixel
+    # buffer slots with glTexSubImage2D so the upload runs asynchronously.
+    # With GL 4.4 buffer storage the ring is one persistently mapped buffer
+    # and a fence per slot keeps a frame from overwriting one still being
+    # read, otherwise a single buffer is orphaned every frame. The texture
+    # name never changes, so it can be handed to renderers once.
+    SLOTS = 3
+    FENCE_TIMEOUT = 5000000
+    PERSISTENT = None
+    FORMATS = {GL.GL_RGBA: 4, GL.GL_RGB: 3}
+
+    def __init__(self, mipmaps=False, slots=SLOTS):
+        self.mipmaps = mipmaps
+        self.slots = slots
+        self.texture = GL.glGenTextures(1)
+        self.width = 0
+        self.height = 0
+        self.format = None
+        self.buffer = None
+        self.mapped = None
+        self.fences = []
+        self.slot = 0
+        self.slotSize = 0
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR_MIPMAP_LINEAR if mipmaps else GL.GL_LINEAR)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    def upload(self, width, height, pixels, format=GL.GL_RGBA):
+        # pixels are bottom row first, tightly packed
+        if width != self.width or height != self.height or format != self.format:
+            self.__allocate(width, height, format)
+        if len(pixels) < self.slotSize: return
+
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self.buffer)
+        slot = None
+        if self.mapped != None:
+            slot = self.__nextSlot()
+            offset = slot*self.slotSize
+            ctypes.memmove(self.mapped + offset, pixels, self.slotSize)
+        else:
+            offset = 0
+            GL.glBufferData(GL.GL_PIXEL_UNPACK_BUFFER, self.slotSize, None, GL.GL_STREAM_DRAW)
+            GL.glBufferSubData(GL.GL_PIXEL_UNPACK_BUFFER, 0, self.slotSize, pixels)
+
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GL.glTexSubImage2D(GL.GL_TEXTURE_2D, 0, 0, 0, width, height, format, GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(offset))
+        if self.mipmaps: GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
+        if slot != None:
+            self.fences[slot] = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def __nextSlot(self):
+        # waits for the gpu to finish reading the slot's last frame, with
+        # enough slots this only happens when the gpu is frames behind
+        slot = self.slot
+        self.slot = (slot+1) % self.slots
+        fence = self.fences[slot]
+        if fence != None:
+            GL.glClientWaitSync(fence, GL.GL_SYNC_FLUSH_COMMANDS_BIT, StreamingTexture.FENCE_TIMEOUT)
+            GL.glDeleteSync(fence)
+            self.fences[slot] = None
+        return slot
+
+    def __allocate(self, width, height, format):
+        self.__releaseBuffer()
+        self.width = width
+        self.height = height
+        self.format = format
+        self.slotSize = width*height*StreamingTexture.FORMATS[format]
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        GL.glTexImage2D(GL.GL_TEXTURE_2D, 0, GL.GL_RGBA8, width, height, 0, format, GL.GL_UNSIGNED_BYTE, None)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        self.buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self.buffer)
+        if StreamingTexture.PERSISTENT != False:
+            try:
+                self.__mapPersistent()
+                StreamingTexture.PERSISTENT = True
+            except Exception:
+                # no GL 4.4 buffer storage, orphan instead
+                StreamingTexture.PERSISTENT = False
+                GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+                GL.glDeleteBuffers(1, [self.buffer])
+                self.buffer = GL.glGenBuffers(1)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def __mapPersistent(self):
+        flags = GL.GL_MAP_WRITE_BIT | GL.GL_MAP_PERSISTENT_BIT | GL.GL_MAP_COHERENT_BIT
+        size = self.slotSize*self.slots
+        GL.glBufferStorage(GL.GL_PIXEL_UNPACK_BUFFER, size, None, flags)
+        mapped = ctypes.cast(GL.glMapBufferRange(GL.GL_PIXEL_UNPACK_BUFFER, 0, size, flags), ctypes.c_void_p).value
+        if mapped == None: raise RuntimeError('glMapBufferRange failed')
+        self.mapped = mapped
+        self.fences = [None]*self.slots
+        self.slot = 0
+
+    def __releaseBuffer(self):
+        if self.buffer == None: return
+        for fence in self.fences:
+            if fence != None: GL.glDeleteSync(fence)
+        if self.mapped != None:
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self.buffer)
+            GL.glUnmapBuffer(GL.GL_PIXEL_UNPACK_BUFFER)
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+        GL.glDeleteBuffers(1, [self.buffer])
+        self.buffer = None
+        self.mapped = None
+        self.fences = []
+
+    def delete(self):
+        self.__releaseBuffer()
+        GL.glDeleteTextures(1, [self.texture])
+        self.texture = None
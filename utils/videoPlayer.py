@@ -2,6 +2,8 @@ import cv2
 from PIL import Image
 import OpenGL.GL as GL
 
+from utils.streamingTexture import StreamingTexture
+
 class VideoPlayer:
 
     @classmethod
@@ -32,8 +34,8 @@ class VideoPlayer:
         self.__initTexture()
  
     def __initTexture(self):
-        self.texture = GL.glGenTextures(1)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
+        self.streamTexture = StreamingTexture()
+        self.texture = self.streamTexture.texture
     
     def update(self, delta):
         self.delta += delta
@@ -54,18 +56,7 @@ class VideoPlayer:
         image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         image = Image.fromarray(frame)
         imgbyte = image.transpose(Image.FLIP_TOP_BOTTOM).tobytes()
-
-        GL.glBindTexture(GL.GL_TEXTURE_2D, self.texture)
-
-        #texture options
-        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_CLAMP_TO_EDGE)
-        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_CLAMP_TO_EDGE)
-        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
-        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
-
-        GL.glTexImage2D(GL.GL_TEXTURE_2D,0,GL.GL_RGBA8,image.width,image.height,0,GL.GL_RGB,GL.GL_UNSIGNED_BYTE,imgbyte)
-        GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
-        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        self.streamTexture.upload(image.width, image.height, imgbyte, GL.GL_RGB)
 
     def restartVideo(self):
         self.delta = 0
@@ -22,6 +22,9 @@ from asset import *
 
 from constants import Constants
 
+from connections.ioLoop import IoLoop
+from connections.telemetryDispatcher import TelemetryDispatcher
+
 from utils.debug import *
 
 import ctypes
@@ -105,6 +108,7 @@ class Window:
     def update(self, delta):
         self.resetHovered()
         self.eventHandler()
+        TelemetryDispatcher.drain()
         self.sceneManager.update(delta)
         self.uiLayer.update(delta)
         GL.glClearColor(0,0,0,1)
@@ -185,6 +189,7 @@ class Window:
         group = asyncio.gather(*pending)
         loop.run_until_complete(group)
         loop.close()
+        IoLoop.shutdown()
         self.stop()
     
     def stop(self):